@@ -1,8 +1,10 @@
 
 import gdb
 import pprint
-from Types import StdTypes 
+import struct
+from Types import LookupType
 from List import ListInspector 
+from PortLayout import GetPort
 #
 # Helper class to deal with registers
 #    
@@ -10,24 +12,13 @@ class aRegisters:
   def  __init__(self):
     self.reg= [0] * 16
     self.psr = 0 
+    self.psplim = 0
+    self.fpu = {}        # s0..s31, fpscr when the frame had the FPU context
+    self.layout = None
     #print("**Create **")
-  def read32bits(self,adr):
-    #print("**Read32 ** :%x" % adr)
-    uint_pointer_type = gdb.lookup_type('uint32_t').pointer()
-    gaddress = gdb.Value(adr)
-    paddress = gaddress.cast(uint_pointer_type)
-    try:
-        c=long(paddress.dereference())
-    #    print("=> %x" % c)
-    except:
-        print("** Error **")
-        c=0
-    return c 
-#
-#
   def write32bits(self,adr,value):
-    adr=long(adr)
-    value=long(value)
+    adr=int(adr)
+    value=int(value)
     #print(adr)
     #print(value)
     st="set {int}"+hex(adr)+" = " +hex(value)
@@ -36,45 +27,51 @@ class aRegisters:
 
 
   #
-  # Dump registers to given address
-  # You have to move the stack yourself !
+  # Dump registers to given address, using the basic frame of the port
+  # You have to move the stack yourself, by FrameSize() bytes !
   #
   def saveRegisterToMemory(self,adr):
-    for i in range(0,8): # R4..R11 => 8 registers
-        self.write32bits(adr+i*4,self.reg[(i+4)])
-    # next are r0 .. r3
-    adr+=8*4
-    for i in range(0,4): # R4..R11 => 8 registers
-        self.write32bits(adr+i*4,self.reg[i])
-    adr+=4*4
-    # Then r12, lr pc psr
-    self.write32bits(adr,self.reg[12])
-    self.write32bits(adr+1*4,self.reg[14])
-    self.write32bits(adr+2*4,self.reg[15])
-    self.write32bits(adr+3*4,self.psr)
+    layout=GetPort().basic
+    values=self.asDict()
+    values["exc_return"]=GetPort().excReturn
+    values["psplim"]=self.psplim
+    gdb.selected_inferior().write_memory(int(adr),layout.Encode(values))
+
+  # size in bytes of the frame written by saveRegisterToMemory
+  def FrameSize(self):
+    return GetPort().basic.size*4
 
   # load all the registers from the psp TCB pointer 
   def loadRegistersFromMemory(self,adr):
-    #print('****')
-    for i in range(0,8): # R4..R11 => 8 registers
-        #print("0")
-        r=self.read32bits(adr+i)
-        #print("1")
-        self.reg[i+4]=r
-    # next are r0 .. r3
-    adr+=8
-    for i in range(0,4): # R4..R11 => 8 registers
-        self.reg[i]=self.read32bits(adr+i)
-    adr+=4
-    # Then r12, lr pc psr
-    self.reg[12]=self.read32bits(adr)
-    self.reg[14]=self.read32bits(adr+1) # LR
-    self.reg[15]=self.read32bits(adr+2) # PC
-    self.psr=self.read32bits(adr+3)
+    adr=int(adr)
+    layout,values=GetPort().ReadFrame(adr)
+    for i in range(0,13):
+        self.reg[i]=values["r"+str(i)]
+    self.reg[14]=values["lr"]
+    self.reg[15]=values["pc"]
+    self.psr=values["xpsr"]
+    self.psplim=values.get("psplim",0)
+    self.fpu={}
+    for name in layout.words:
+        if(name[0]=="s" or name=="fpscr"):
+            self.fpu[name]=values[name]
     # and sp after popping all the registers
-    self.reg[13]=long(adr+4)
-    #for i in range(0,16):
-    #    print("%d : 0x%x" % (i,self.reg[i]))
+    # xpsr bit 9 set means the hardware added a padding word
+    self.reg[13]=adr+layout.size*4
+    if(self.psr & 0x200):
+        self.reg[13]+=4
+    self.layout=layout
+
+  # registers as a dictionary name => value, for the layout tables
+  def asDict(self):
+    values={}
+    for i in range(0,13):
+        values["r"+str(i)]=self.reg[i]
+    values["lr"]=self.reg[14]
+    values["pc"]=self.reg[15]
+    values["xpsr"]=self.psr
+    values.update(self.fpu)
+    return values
   #
   def setRegister(self,reg, value):
     #print(reg)
@@ -89,13 +86,42 @@ class aRegisters:
       r="r"+str(i)
       self.setRegister(r,self.reg[i])
     self.setRegister("xpsr",self.psr)
+    for name,value in self.fpu.items():
+      if(name=="fpscr"):
+        self.setRegister(name,value)
+        continue
+      self.setFloatRegister(name,value)
+
+  # s registers are floats for gdb, build a float value from the raw bits
+  # so NaN / Inf and their payloads are set exactly
+  def setFloatRegister(self,reg,bits):
+    raw=gdb.Value(struct.pack("<I",bits & 0xffffffff),LookupType("float"))
+    gdb.set_convenience_variable("freertos_raw",raw)
+    gdb.execute("set $"+str(reg)+"=$freertos_raw")
+  # raw bits of a s register, Value.bytes keeps NaN payloads, older gdb
+  # only give the float
+  def getFloatRegister(self,frame,reg):
+    value=frame.read_register(reg)
+    if(hasattr(value,"bytes")):
+      return struct.unpack("<I",value.bytes)[0]
+    return struct.unpack("<I",struct.pack("<f",float(value)))[0]
   # read the CPU register and update our internal copy with them
+  # from the innermost frame, the selected one may be an outer frame
+  # (up / down) holding unwound values
   def getCPURegisters(self):
+    frame=gdb.newest_frame()
     for i in range(0,16):
       r="r"+str(i)
-      self.reg[i]=long(gdb.selected_frame().read_register(r) )
+      self.reg[i]=int(frame.read_register(r) )
       self.reg[i]=self.reg[i] & 0xffffffff # unsigned hack
-    self.psr=long(gdb.selected_frame().read_register("xpsr"))
+    self.psr=int(frame.read_register("xpsr"))
+    if(GetPort().basic.offsets.get("psplim") is not None):
+      self.psplim=int(frame.read_register("psplim")) & 0xffffffff
+    self.fpu={}
+    if(GetPort().extended is not None):
+      for i in range(0,32):
+        self.fpu["s"+str(i)]=self.getFloatRegister(frame,"s"+str(i))
+      self.fpu["fpscr"]=int(frame.read_register("fpscr")) & 0xffffffff
     #print("Read registers")
     #for i in range(0,16):
         #print("%d: 0x%x" % (i,self.reg[i]))
@@ -0,0 +1,104 @@
+# File: CoreDump.py
+#
+# Description:
+#   This file contains a minimal writer for ARM ELF core files. The
+# file holds one PT_LOAD segment per RAM region and one NT_PRSTATUS
+# note per FreeRTOS task, so a stock arm-none-eabi-gdb opening it
+# sees every task as a thread (info threads, thread apply all bt...).
+# The first thread added is the one gdb selects when loading the core.
+#
+
+import gdb
+import struct
+
+ELF_HEADER_SIZE = 52
+PROGRAM_HEADER_SIZE = 32
+ET_CORE = 4
+EM_ARM = 40
+PT_LOAD = 1
+PT_NOTE = 4
+PF_W = 2
+PF_R = 4
+NT_PRSTATUS = 1
+SIGTRAP = 5
+
+# struct elf_prstatus for 32 bits ARM, 148 bytes
+#   siginfo (signo, code, errno), cursig, pad, sigpend, sighold,
+#   pid, ppid, pgrp, sid, 4 timevals, r0..r15 cpsr orig_r0, fpvalid
+_PRSTATUS_FORMAT = "<3ih2xII4i8i18Ii"
+
+class CoreFileWriter:
+  """ Collect the memory and the threads, then write the core file
+  """
+  def __init__(self, chunkSize = 64 * 1024):
+    self._chunkSize = chunkSize
+    self._segments = []   # (address, bytes)
+    self._threads = []    # (tid, registers, signal)
+
+  def AddMemory(self, start, end):
+    """ Read [start, end[ from the target by chunks of chunkSize bytes
+    """
+    inferior = gdb.selected_inferior()
+    data = bytearray()
+    address = start
+    while ( address < end ):
+      size = min(self._chunkSize, end - address)
+      data += bytes(inferior.read_memory(address, size))
+      address += size
+    self._segments.append( (start, bytes(data)) )
+
+  def AddThread(self, tid, registers, cpsr, signal = 0):
+    """ registers is the list of r0..r15
+    """
+    regs = [r & 0xffffffff for r in registers[0:16]]
+    self._threads.append( (tid, regs + [cpsr & 0xffffffff, 0], signal) )
+
+  def _buildNotes(self):
+    notes = bytearray()
+    name = b"CORE\0\0\0\0"   # "CORE\0" padded to 4 bytes
+    for tid, regs, signal in self._threads:
+      desc = struct.pack(_PRSTATUS_FORMAT,
+                         signal, 0, 0, signal, 0, 0,
+                         tid, 0, 0, 0,
+                         0, 0, 0, 0, 0, 0, 0, 0,
+                         *(regs + [0]))
+      notes += struct.pack("<3I", 5, len(desc), NT_PRSTATUS)
+      notes += name + desc
+    return(bytes(notes))
+
+  def Write(self, fileName):
+    notes = self._buildNotes()
+    nbHeaders = 1 + len(self._segments)
+    offset = ELF_HEADER_SIZE + PROGRAM_HEADER_SIZE * nbHeaders
+
+    ident = b"\x7fELF" + bytes(bytearray([1, 1, 1, 0])) + b"\0" * 8
+    header = ident + struct.pack("<HHIIIIIHHHHHH",
+                                 ET_CORE, EM_ARM, 1, 0,
+                                 ELF_HEADER_SIZE, 0, 0,
+                                 ELF_HEADER_SIZE, PROGRAM_HEADER_SIZE, nbHeaders,
+                                 0, 0, 0)
+    programHeaders = struct.pack("<8I", PT_NOTE, offset, 0, 0, len(notes), 0, 0, 4)
+    offset += len(notes)
+    for address, data in self._segments:
+      programHeaders += struct.pack("<8I", PT_LOAD, offset, address, address,
+                                    len(data), len(data), PF_R | PF_W, 1)
+      offset += len(data)
+
+    with open(fileName, "wb") as f:
+      f.write(header)
+      f.write(programHeaders)
+      f.write(notes)
+      for address, data in self._segments:
+        f.write(data)
+
+def GetRamRegions():
+  """ Return the read/write regions of the target memory map
+      (info mem) as a list of (start, end)
+  """
+  regions = []
+  for line in gdb.execute("info mem", to_string = True).splitlines():
+    tokens = line.split()
+    addresses = [t for t in tokens if t.startswith("0x")]
+    if ( "rw" in tokens and len(addresses) >= 2 ):
+      regions.append( (int(addresses[0], 16), int(addresses[1], 16)) )
+  return(regions)
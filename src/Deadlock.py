@@ -0,0 +1,234 @@
+# File: Deadlock.py
+#
+# Description:
+#   This file contains the implementation of a wait-for graph built
+# from one snapshot of the kernel objects. A task points to the object
+# it is waiting on, a mutex points to the task holding it. A task can
+# only wait on one object and a mutex has at most one holder, so each
+# node has at most one successor and cycles / priority inversion
+# chains are found in linear time.
+#
+#   The objects are not only taken from the handle registry: the
+# xEventListItem of a blocked task is in the waiting list of the object
+# it waits on, the object is found back from the offset of that list in
+# Queue_t / EventGroup_t. So unregistered mutexes are examined too.
+#
+
+import gdb
+
+from List import ListInspector
+from Task import TaskInspector
+from Queue import QueueInspector
+from EventGroup import EventGroupInspector
+
+def _fieldOffset(gdbType, name):
+  for f in gdbType.fields():
+    if ( f.name == name ):
+      return(f.bitpos // 8)
+  raise gdb.GdbError("%s not in %s" % (name, str(gdbType)))
+
+def _isList(address):
+  """ vListInitialise sets xListEnd.xItemValue to portMAX_DELAY, use it
+      to check that a List_t lives at address
+  """
+  try:
+    listObj = gdb.Value(address).cast(ListInspector.ListType.pointer()).dereference()
+    value = listObj['xListEnd']['xItemValue']
+    return( int(value) == (1 << (8 * value.type.sizeof)) - 1 )
+  except gdb.error:
+    return(False)
+
+def _pendingReadyLists():
+  """ Addresses of xPendingReadyList (one per core on SMP kernels), the
+      event item of a task unblocked while the scheduler was suspended
+      is parked there
+  """
+  symbol, methodType = gdb.lookup_symbol("xPendingReadyList")
+  if ( symbol is None ):
+    return([])
+  value = symbol.value()
+  if ( value.type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY ):
+    minIndex, maxIndex = value.type.range()
+    return([int(value[i].address) for i in range(minIndex, maxIndex+1)])
+  return([int(value.address)])
+
+class WaitForGraph:
+  """ Wait-for graph between tasks and queue / mutex / event group
+      objects
+  """
+  def __init__(self):
+    self._tasks = {}     # tcb address => (name, priority, base priority)
+    self._objects = {}   # object address => (kind, name)
+    self._waits = {}     # tcb address => object address
+    self._holders = {}   # object address => tcb address
+
+  def _addTask(self, tcb):
+    """ tcb is a L{gdb.Value} of type TCB_t, return its address
+    """
+    address = int(tcb.address)
+    if ( address not in self._tasks ):
+      task = TaskInspector(tcb)
+      priority = int(task.GetPriority())
+      try:
+        basePriority = int(tcb['uxBasePriority'])
+      except gdb.error:
+        # configUSE_MUTEXES not set, no inheritance
+        basePriority = priority
+      self._tasks[address] = (task.GetName(), priority, basePriority)
+    return(address)
+
+  def _addWaiters(self, objAddress, waiters):
+    for tcb, val, ptr in waiters:
+      self._waits[self._addTask(tcb)] = objAddress
+
+  def AddQueue(self, q):
+    """ Add a L{QueueInspector} object, its waiting tasks and holder
+    """
+    address = q.GetAddress()
+    holder = q.GetMutexHolder()
+    kind = "mutex" if q.IsMutex() else "queue"
+    self._objects[address] = (kind, q.GetName())
+    self._addWaiters(address, q.GetTasksWaitingToSend())
+    self._addWaiters(address, q.GetTasksWaitingToReceive())
+    if ( holder is not None ):
+      self._holders[address] = self._addTask(holder.dereference())
+
+  def AddEventGroup(self, evtGrp, name = None):
+    """ Add a L{EventGroupInspector} object and its waiting tasks
+    """
+    address = evtGrp.GetAddress()
+    self._objects[address] = ("event group", name)
+    self._addWaiters(address, evtGrp.GetTasksWaiting())
+
+  def _findWaitObject(self, tcb):
+    """ Return the L{QueueInspector} / L{EventGroupInspector} the task is
+        waiting on, None if it is not waiting on an object, raise a
+        ValueError if the object cannot be identified
+    """
+    item = tcb['xEventListItem']
+    try:
+      container = int(item['pxContainer'])
+    except gdb.error:
+      # Before FreeRTOS 10
+      container = int(item['pvContainer'])
+    if ( container == 0 or container in _pendingReadyLists() ):
+      return(None)
+    # taskEVENT_LIST_ITEM_VALUE_IN_USE, the top bit of the item value,
+    # is only set by the event groups
+    value = item['xItemValue']
+    inUse = 1 << (8 * value.type.sizeof - 1)
+    if ( int(value) & inUse ):
+      address = container - _fieldOffset(EventGroupInspector.EvtGrpType, "xTasksWaitingForBits")
+      return(EventGroupInspector(address))
+    queueType = QueueInspector.QueueType
+    toSend = _fieldOffset(queueType, "xTasksWaitingToSend")
+    toReceive = _fieldOffset(queueType, "xTasksWaitingToReceive")
+    # The other waiting list of the queue must be a list too
+    if ( _isList(container - toReceive + toSend) ):
+      return(QueueInspector(container - toReceive))
+    if ( _isList(container - toSend + toReceive) ):
+      return(QueueInspector(container - toSend))
+    raise ValueError("Unknown wait list 0x%08x" % container)
+
+  def AddBlockedTasks(self, tcbs):
+    """ Add the objects the given tasks (L{gdb.Value} of type TCB_t) are
+        blocked on, when not already in the graph
+        Return the addresses of the tasks whose object was not identified
+    """
+    unknown = []
+    for tcb in tcbs:
+      try:
+        obj = self._findWaitObject(tcb)
+      except (ValueError, gdb.error, gdb.GdbError):
+        unknown.append(self._addTask(tcb))
+        continue
+      if ( obj is None or obj.GetAddress() in self._objects ):
+        continue
+      if ( isinstance(obj, EventGroupInspector) ):
+        self.AddEventGroup(obj)
+      else:
+        self.AddQueue(obj)
+    return(unknown)
+
+  def _next(self, node):
+    if ( node in self._waits ):
+      return(self._waits[node])
+    return(self._holders.get(node))
+
+  def Analyze(self):
+    """ Walk the graph once
+        Return (cycles, inversions), cycles being lists of nodes and
+        inversions lists of (waiting task, lowest priority task it
+        depends on)
+    """
+    onPath = 1
+    done = 2
+    state = {}
+    lowest = {}   # node => tcb with the lowest base priority reachable from it
+    cycles = []
+    nodes = list(self._waits.keys()) + list(self._holders.keys())
+
+    def lowestOf(a, b):
+      if ( a is None ):
+        return(b)
+      if ( b is None or self._tasks[a][2] <= self._tasks[b][2] ):
+        return(a)
+      return(b)
+
+    for start in nodes:
+      path = []
+      node = start
+      while ( node is not None and node not in state ):
+        state[node] = onPath
+        path.append(node)
+        node = self._next(node)
+      tail = None
+      if ( node is not None ):
+        if ( state[node] == onPath ):
+          # Closed a loop on the current path
+          index = path.index(node)
+          cycle = path[index:]
+          cycles.append(cycle)
+          for n in cycle:
+            if ( n in self._tasks ):
+              tail = lowestOf(tail, n)
+          for n in cycle:
+            lowest[n] = tail
+            state[n] = done
+          path = path[:index]
+        else:
+          tail = lowest[node]
+      for n in reversed(path):
+        if ( n in self._tasks ):
+          tail = lowestOf(tail, n)
+        lowest[n] = tail
+        state[n] = done
+
+    inversions = []
+    for task, obj in self._waits.items():
+      culprit = lowest[obj]
+      if ( culprit is not None and culprit != task and self._tasks[culprit][2] < self._tasks[task][1] ):
+        inversions.append( (task, culprit) )
+    return(cycles, inversions)
+
+  def GetChain(self, start):
+    """ Return the list of nodes followed from start, stopping at the end
+        of the chain or when a node repeats
+    """
+    chain = []
+    seen = set()
+    node = start
+    while ( node is not None and node not in seen ):
+      seen.add(node)
+      chain.append(node)
+      node = self._next(node)
+    return(chain)
+
+  def Describe(self, node):
+    if ( node in self._tasks ):
+      name, priority, basePriority = self._tasks[node]
+      return("task %s(0x%08x prio %d/%d)" % (name, node, priority, basePriority))
+    kind, name = self._objects.get(node, ("object", None))
+    if ( name is None ):
+      return("%s 0x%08x" % (kind, node))
+    return("%s %s(0x%08x)" % (kind, name, node))
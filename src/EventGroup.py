@@ -9,14 +9,16 @@
 import gdb
 from List import ListInspector
 from Task import TaskInspector
+from Types import LazyType
 
 class EventGroupInspector: 
-  EvtGrpType = gdb.lookup_type("EventGroup_t") 
+  EvtGrpType = LazyType("EventGroup_t")
 
   def __init__(self, handle): 
     """
     """
-    self._evtgrp = gdb.Value(handle).cast(EventGroupInspector.EvtGrpType)
+    evtgrpPtr = gdb.Value(handle).cast(EventGroupInspector.EvtGrpType.pointer())
+    self._evtgrp = evtgrpPtr.dereference()
 
   def GetTasksWaiting(self): 
     """ 
@@ -26,6 +28,11 @@ class EventGroupInspector:
     return(taskList.GetElements(TaskInspector.TCBType))
 
 
+  def GetAddress(self):
+    """ Return the address of the event group object as an int
+    """
+    return( int(self._evtgrp.address) )
+
   def GetEventBits(self): 
     """ Get the Event Flag Bits 
       @return L{gdb.Value} of EventBits_t 
@@ -1,5 +1,5 @@
 # File: FreeRTOS.py
-# This is the arm without ** FPU ** version of the original freeRTS GDB
+# This is the arm version of the original freeRTS GDB
 # It was modified by mean00 to add 
 #    * More details on TCB, display similar to info threads
 #    * switchTCB command to switch threads
@@ -16,215 +16,196 @@
 # 
 
 import gdb
+import json
 import pprint
 from Types import StdTypes 
 from List import ListInspector 
 from GDBCommands import ShowHandleName, ShowRegistry, ShowList
-from GDBCommands import ShowQueueInfo
-from ArmRegisters import aRegisters
+from GDBCommands import ShowQueueInfo, FreeRTOSPrefix, ShowDeadlocks, SelectPort
+from GDBCommands import SplitJsonFlag, TraceSwitches
+from Journal import GetJournal
+from TaskFilter import TaskFilter
+from Scheduler import Scheduler
 
 #
-# Helper class to deal with registers
-#    
-class Scheduler:
-  
+#
+#
+#
+class ShowTaskList(gdb.Command):
+  """ Generate a print out of the current tasks and their states.
+      Optional filters : state=Ready|Blocked|Suspended|Delayed name=<glob> prio<op>N stack<op>N
+      (op being one of = != < <= > >=, stack being the free stack in words)
+      --json prints the tasks as a JSON list
+  """
   def __init__(self):
-    self.allTasks = [] 
-    self._blocked = ListInspector("xSuspendedTaskList")
-    self._delayed1 = ListInspector("xDelayedTaskList1")
-    self._delayed2 = ListInspector("xDelayedTaskList2")
-    self._readyLists = []
-    readyTasksListsStr = "pxReadyTasksLists"
-    # Current TCB
-    self._currentTCB,tcbMethod=gdb.lookup_symbol("pxCurrentTCB")
-    if( self._currentTCB != None):
-        self._currentTCBv=self._currentTCB.value()
-    self._currentTCBAddress= gdb.parse_and_eval("pxCurrentTCB").address
-     # Ready 
-    readyListsSym,methodType = gdb.lookup_symbol(readyTasksListsStr)
-    if ( readyListsSym != None ): 
-      readyLists = readyListsSym.value()
-      minIndex, maxIndex = readyLists.type.range()
-      for i in range(minIndex, maxIndex+1):
-        readyList = readyLists[i]
-        FRReadyList = ListInspector( readyList )
-        self._readyLists.append(FRReadyList)
-      self.getTasks()
-    else: 
-      print("Failed to Find Symbol: %s" % readyTasksListsStr)
-      raise ValueError("Invalid Symbol!")
-
-  # sort by TCB
-  def sortTCB(self,e):
-    return e[0]
-#
-# dump the tasks
-#
-  def ShowTaskList(self): 
-     # dump them
-    dex=0
-    for t in self.allTasks:
-        tcbPointer=t[0]
-        status=t[1]
-        tcbContent=t[2]
-        # Current Task, info on the stack are irrelevant
-        if(self._currentTCBv == tcbPointer):
-            current="*"
-            print("%d %s TCB: 0x%08x Name:%12s " % (dex,current, tcbPointer,tcbContent['pcTaskName'].string()))
-        else:
-            #where=
-            current=" "
-            stack=tcbContent['pxTopOfStack']
-            where=""
-            print("%d %s TCB: 0x%08x Name:%12s State:%s TopOfStack:0x%08x" % (dex, current, tcbPointer,tcbContent['pcTaskName'].string(), status, stack))
-            self.getAdditionInfo(stack)
-        dex=dex+1
-#
-# Get a list of created tasks + some properties
-#
-  def getTasks(self): 
-    for i,rlist in enumerate(self._readyLists):
-      if i == 0:
-        items = rlist.GetElements( "TCB_t", 0 )
-      else: 
-        items = rlist.GetElements( "TCB_t", 1 )
-      if ( len(items) > 0 ): 
-        for tcb,val,ptr in items:           
-          ## print(tcb, tcb.type.name, val, val.type.name)
-          tem = [ptr,"Ready ",tcb,None]
-          self.allTasks.append(tem)
-
-    items = self._blocked.GetElements("TCB_t")
-    for tcb,val,ptr in items:  
-          tem = [ptr,"Blked ",tcb,None]
-          self.allTasks.append(tem)
-
-    items = self._delayed1.GetElements("TCB_t")
-    for tcb,val,ptr in items:           
-          tem = [ptr,"Delay1",tcb,None]
-          self.allTasks.append(tem)
+    super(ShowTaskList, self).__init__(
+      "show Task-List", 
+      gdb.COMMAND_SUPPORT
+      )
 
-    items = self._delayed2.GetElements("TCB_t")
-    for tcb,val,ptr in items:           
-          tem = [ptr,"Delay1",tcb,None]
-          self.allTasks.append(tem)
+  def invoke(self, arg, from_tty):
+    argv,asJson = SplitJsonFlag(gdb.string_to_argv(arg))
+    try:
+        taskFilter=TaskFilter(argv)
+    except ValueError as exc:
+        print(str(exc))
+        return
+    if(asJson):
+        from Snapshot import KernelSnapshot
+        snapshot=KernelSnapshot(taskFilter,False)
+        print(json.dumps(snapshot.tasks))
+        return
+    sched = Scheduler(taskFilter)
+    sched.ShowTaskList()
 
-    self.allTasks.sort(key=self.sortTCB)
 #
 #
 #
-  def GetSymbolForAddress(self,adr):
-     block = gdb.block_for_pc(adr)
-     try:
-        while block and not block.function:
-           block = block.superblock
-        return block.function.print_name
-     except:
-       print("*Error *")
-       return "???"
 #
+class ShowTaskRuntime(gdb.Command):
+  """ Show the CPU share of each task since boot and since the previous halt
+      (needs configGENERATE_RUN_TIME_STATS)
+  """
+  def __init__(self):
+    super(ShowTaskRuntime, self).__init__(
+      "show Task-Runtime",
+      gdb.COMMAND_SUPPORT
+      )
+
+  def invoke(self, arg, from_tty):
+    from RunTime import RunTimeInspector
+    sched = Scheduler()
+    try:
+        inspector=RunTimeInspector()
+    except ValueError as exc:
+        print(str(exc))
+        return
+    tasks=[]
+    for t in sched.allTasks:
+        tasks.append( (int(t[0]),t[2]['pcTaskName'].string()) )
+    print("%12s %12s %8s %12s %8s" % ("NAME", "COUNTER", "BOOT%", "DELTA", "DELTA%"))
+    for tcb,name,counter,bootPercent,delta,deltaPercent in inspector.GetStats(tasks):
+        print("%12s %12d %8.2f %12d %8.2f" % (name, counter, bootPercent, delta, deltaPercent))
 #
 #
-  def Read32(self,address):
-    uint_pointer_type = gdb.lookup_type('uint32_t').pointer()
-    gaddress = gdb.Value(address)
-    paddress = gaddress.cast(uint_pointer_type)
-    try:
-        c=long(paddress.dereference())
-    except:
-        print("*Error *")
-        c=0
-    return c 
-
 #
 #
+class ProfileTasks(gdb.Command):
+  """ Sample the running task and PC for <seconds> at <hz> samples per second
+      freertos profile <seconds> <hz> [collapsed stack output file]
+  """
+  def __init__(self):
+    super(ProfileTasks, self).__init__(
+      "freertos profile",
+      gdb.COMMAND_SUPPORT
+      )
+
+  def invoke(self, arg, from_tty):
+    argv = gdb.string_to_argv(arg)
+    if(len(argv)<2):
+        print("Please give duration (s) and frequency (Hz) as parameters\n");
+        return
+    duration=float(argv[0])
+    frequency=float(argv[1])
+    if(duration<=0 or frequency<=0):
+        print("Duration and frequency must be positive")
+        return
+    from Profiler import TaskProfiler
+    profiler=TaskProfiler(Scheduler.GetSymbolForAddress)
+    profiler.Sample(duration,frequency)
+    profiler.PrintReport()
+    if(len(argv)>2):
+        profiler.WriteCollapsed(argv[2])
+        print("Collapsed stacks written to %s" % argv[2])
 #
-  def getAdditionInfo(self, topStack):
-    # Now retrieve actual stack pointer, PC and LR
-    # The layout is 
-    # Top Base : 8*4 = R4...R11
-    #            4*4 = R0...R3
-    #            1*4 = R12
-    #            1*4 = LR
-    #            1*4 = PC
-    #            1*4 = PSR
-    #print("base 0x%x" % (topStack))
-    importantRegisters=topStack+(13) # skip registers
-    LR=self.Read32(importantRegisters)
-    PC=self.Read32(importantRegisters+1)
-    # This is the address of the user stack, i.e. after the 16 registers saved by FreeRTOS
-    actualStack=topStack+16
-    print("\t\t LR=0x%x PC=0x%x SP=0x%x function=%s" % (LR, PC, actualStack,self.GetSymbolForAddress(PC)))
 #
 #
 #
-  def switchTCB(self,task):
-    print("switch TCB %d " % task)
-    # Dereference address to get stack
-    if(task>=len(self.allTasks)):
-        print("out of range")
-        return
+class WriteSnapshot(gdb.Command):
+  """ Append the tasks, queues and registry as one JSON line to a file
+      freertos snapshot <file>   (without file, print it)
+  """
+  def __init__(self):
+    super(WriteSnapshot, self).__init__(
+      "freertos snapshot",
+      gdb.COMMAND_SUPPORT,
+      gdb.COMPLETE_FILENAME
+      )
 
-    # First save the current task
-    old=aRegisters()
-    old.getCPURegisters()
-    found=None
-    # Search the current TCB
-    for t in self.allTasks:
-        if(t[0]==self._currentTCBv):
-            # got it
-            found=t[2]
-    if( found is None):
-        print("Cannot locate current TCB")
-        return
-    #
-    # Rewind by 4*4*4 bytes = 64 bytes / 16 registers
-    sp=old.reg[13]
-    sp-=64    
-    # store them
-    old.saveRegisterToMemory(sp) 
-    # update xtopStack with new value
-    old.write32bits(self._currentTCBv,old.reg[13]-64)
-    t=self.allTasks[task]
-    # [0] => TCB pointer
-    # [1] => State
-    # [2] => TCB structure 
-    if(t[0]==self._currentTCBv):
-        print("task already selected")
+  def invoke(self, arg, from_tty):
+    from Snapshot import KernelSnapshot
+    argv = gdb.string_to_argv(arg)
+    snapshot=KernelSnapshot()
+    if(len(argv)==0):
+        print(snapshot.ToJson())
         return
-    tcbContent=t[2]
-    stack=tcbContent['pxTopOfStack']
-    # 1-load registers
-    regs=aRegisters()
-    regs.loadRegistersFromMemory(stack) # regs now contains the address
-    regs.setCPURegisters()   # set the actual registers
-
-    # update pxCurrentTCB
-    print("Updating current TCB to %x" % t[0])
-    regs.write32bits( self._currentTCBAddress,t[0]) 
+    with open(argv[0],"a") as f:
+        snapshot.WriteJson(f)
 #
 #
 #
 #
-class ShowTaskList(gdb.Command):
-  """ Generate a print out of the current tasks and their states.
+class GenerateCore(gdb.Command):
+  """ Write an ELF core file with one thread per task
+      freertos gcore <file> [start:end ...]
+      Without memory range, the rw regions of "info mem" are dumped
   """
   def __init__(self):
-    super(ShowTaskList, self).__init__(
-      "show Task-List", 
-      gdb.COMMAND_SUPPORT
+    super(GenerateCore, self).__init__(
+      "freertos gcore",
+      gdb.COMMAND_SUPPORT,
+      gdb.COMPLETE_FILENAME
       )
 
   def invoke(self, arg, from_tty):
+    argv = gdb.string_to_argv(arg)
+    if(len(argv)<1):
+        print("Please give the core file name as parameter\n");
+        return
+    from CoreDump import CoreFileWriter, GetRamRegions, SIGTRAP
+    if(not GetJournal().IsEmpty()):
+        # The stacks and pxCurrentTCB hold the frames written by switchTCB
+        print("switchTCB changed the target, run switchTCB --restore first")
+        return
+    regions=[]
+    for r in argv[1:]:
+        try:
+            start,end=[int(v,0) for v in r.split(":")]
+            if(end<=start):
+                raise ValueError(r)
+            regions.append( (start,end) )
+        except ValueError:
+            print("Invalid memory range %s, usage: freertos gcore <file> [start:end ...]" % r)
+            return
+    if(len(regions)==0):
+        regions=GetRamRegions()
+    if(len(regions)==0):
+        print("No rw memory region found, please give them as start:end")
+        return
     sched = Scheduler()
-    sched.ShowTaskList()
-
+    core=CoreFileWriter()
+    for start,end in regions:
+        print("Reading 0x%08x-0x%08x" % (start,end))
+        core.AddMemory(start,end)
+    # The running task goes first, gdb selects it when opening the core
+    tasks=sorted(sched.allTasks,key=lambda t: sched.getCoreOf(t[0]) != sched._selectedCore)
+    for dex,t in enumerate(tasks):
+        regs=sched.getTaskRegisters(t)
+        signal=0
+        if(dex==0):
+            signal=SIGTRAP
+        core.AddThread(dex+1,regs.reg,regs.psr,signal)
+    core.Write(argv[0])
+    print("Wrote %s: %d tasks, %d regions" % (argv[0],len(tasks),len(regions)))
 #
 #
 #
 #
 class SwitchTCB(gdb.Command):
-  """ Switch to the TCB address given as parameter (hex address i.e 0x1234)
+  """ Switch to the task given as parameter, either its index in the
+      unfiltered Task-List or its TCB address (hex address i.e 0x1234)
+      switchTCB --restore puts back the original context, it is also done
+      by the hook-continue, hook-step... commands before resuming
   """
   def __init__(self):
     super(SwitchTCB, self).__init__(
@@ -237,14 +218,43 @@ class SwitchTCB(gdb.Command):
     if(len(argv)!=1):
         print("Please give Task index as paramter\n");
         return
+    if(argv[0]=="--restore"):
+        journal=GetJournal()
+        if(journal.IsEmpty()):
+            # called by the resume hooks each time, stay quiet there
+            if(from_tty):
+                print("Nothing to restore")
+            return
+        runs=journal.Restore()
+        print("Original context restored (%d memory writes)" % runs)
+        return
     sched = Scheduler()
-    task=int(argv[0])
+    if(argv[0].startswith("0x")):
+        # TCB address, as shown by a filtered Task-List
+        tcb=int(argv[0],16)
+        task=None
+        for dex,t in enumerate(sched.allTasks):
+            if(int(t[0])==tcb):
+                task=dex
+        if(task is None):
+            print("No task with TCB 0x%08x" % tcb)
+            return
+    else:
+        task=int(argv[0])
     sched.switchTCB(task)
     #
+FreeRTOSPrefix()
 ShowRegistry()
 ShowList()
 ShowTaskList()
+ShowTaskRuntime()
 ShowHandleName()
 ShowQueueInfo()
 SwitchTCB()
+ProfileTasks()
+ShowDeadlocks()
+SelectPort()
+GenerateCore()
+WriteSnapshot()
+TraceSwitches()
 
@@ -8,14 +8,56 @@
 
 
 import gdb
+import json
 from List import ListInspector
 from Task import TaskInspector
 from HandleRegistry import HandleRegistry
 from Queue import QueueInspector, QueueMode
+import PortLayout
+
+def SplitJsonFlag(argv):
+  """ Remove --json from the arguments 
+      Return (remaining arguments, True if --json was there)
+  """
+  rest = [a for a in argv if a != "--json"]
+  return( (rest, len(rest) != len(argv)) )
+
+class FreeRTOSPrefix(gdb.Command):
+  """ Prefix for the FreeRTOS commands (freertos profile, ...)
+  """
+  def __init__(self):
+    super(FreeRTOSPrefix, self).__init__(
+      "freertos",
+      gdb.COMMAND_SUPPORT,
+      gdb.COMPLETE_NONE,
+      True
+      )
+
+class SelectPort(gdb.Command):
+  """ Select the FreeRTOS port used to decode the stacked frames
+      freertos port [CM0|CM3|CM4|CM4F|CM7|CM23|CM33]
+      Without parameter, print the current one
+  """
+  def __init__(self):
+    super(SelectPort, self).__init__(
+      "freertos port",
+      gdb.COMMAND_SUPPORT
+      )
+
+  def invoke(self, arg, from_tty):
+    argv = gdb.string_to_argv(arg)
+    if ( len(argv) > 0 ):
+      try:
+        PortLayout.SetPort(argv[0])
+      except KeyError:
+        print("Unknown port %s, valid ones are %s" % (argv[0], " ".join(sorted(PortLayout.Ports.keys()))))
+        return
+    print("Port: %s" % PortLayout.GetPort().name)
 
 class ShowQueueInfo(gdb.Command): 
   """ Generate a print out of info about a particular 
       set of queues.
+      --json prints the queues as a JSON list
   """
   def __init__(self): 
     super(ShowQueueInfo, self).__init__(
@@ -24,7 +66,7 @@ class ShowQueueInfo(gdb.Command):
       )
 
   def invoke(self, arg, from_tty): 
-    argv = gdb.string_to_argv(arg)
+    argv, asJson = SplitJsonFlag(gdb.string_to_argv(arg))
     
     qTypes = []     
     if( len(argv) > 0 ):
@@ -33,7 +75,7 @@ class ShowQueueInfo(gdb.Command):
           qType = QueueMode.Map[a]
           qTypes.append(qType)
         except KeyError: 
-          print("Arg %s does not map to a Queue Type!" % a)
+          gdb.write("Arg %s does not map to a Queue Type!\n" % a, gdb.STDERR)
     
     reg = HandleRegistry()
     qToShow = []
@@ -45,6 +87,11 @@ class ShowQueueInfo(gdb.Command):
     else: 
       qToShow = reg.FilterBy(None)
 
+    if ( asJson ):
+      from Snapshot import QueueRecord
+      print(json.dumps([QueueRecord(q) for q in qToShow]))
+      return
+
     print("Num Queues: %d" % len(qToShow))
     print("%20s %4s %16s %16s" % ("NAME", "CNT", "SEND", "RECEIVE") )
     for q in qToShow:
@@ -67,12 +114,12 @@ class ShowQueueInfo(gdb.Command):
       for i in range(0, maxCount): 
         txName = ""
         if ( i < len(sendList) ):
-          tcbRef,val = sendList[i]
+          tcbRef = sendList[i][0]
           tcb=TaskInspector(tcbRef)
           txName = tcb.GetName()
         rxName = ""
         if ( i < len(rxList) ):
-          tcbRef,val = rxList[i]
+          tcbRef = rxList[i][0]
           tcb = TaskInspector(tcbRef)
           rxName = tcb.GetName()
 
@@ -82,6 +129,121 @@ class ShowQueueInfo(gdb.Command):
           print( outputFmt % ("", "", txName, rxName))
 
 
+class ShowDeadlocks(gdb.Command):
+  """ Build the wait-for graph of the queues / mutexes / event groups
+      the blocked tasks wait on (registered or not, plus the event group
+      handles given as parameters) and report the deadlocks and priority
+      inversion chains
+      freertos deadlocks [event group handle ...]
+  """
+  def __init__(self):
+    super(ShowDeadlocks, self).__init__(
+      "freertos deadlocks",
+      gdb.COMMAND_SUPPORT
+      )
+
+  def invoke(self, arg, from_tty):
+    from EventGroup import EventGroupInspector
+    from Deadlock import WaitForGraph
+    from Scheduler import Scheduler
+    argv = gdb.string_to_argv(arg)
+    try:
+      handles = [int(a, 0) for a in argv]
+    except ValueError:
+      print("Usage: freertos deadlocks [event group handle ...]")
+      return
+    graph = WaitForGraph()
+    # Registered objects first, they come with their names
+    reg = HandleRegistry()
+    for q in reg.FilterBy(None):
+      graph.AddQueue(q)
+    for handle in handles:
+      graph.AddEventGroup(EventGroupInspector(handle))
+    sched = Scheduler()
+    blocked = [t[2] for t in sched.allTasks if t[1] != "Ready "]
+    unknown = graph.AddBlockedTasks(blocked)
+
+    cycles, inversions = graph.Analyze()
+    if ( len(cycles) == 0 and len(unknown) == 0 ):
+      print("No deadlock found")
+    elif ( len(cycles) == 0 ):
+      print("No deadlock found among the objects examined")
+    if ( len(unknown) > 0 ):
+      # Not proven free of deadlock
+      print("Wait object not identified, not examined:")
+      for task in unknown:
+        print("  %s" % graph.Describe(task))
+    for cycle in cycles:
+      print("Deadlock:")
+      for node in cycle:
+        print("  %s" % graph.Describe(node))
+      print("  -> %s" % graph.Describe(cycle[0]))
+    for task, culprit in inversions:
+      print("Priority inversion, %s waits on %s:" % (graph.Describe(task), graph.Describe(culprit)))
+      for node in graph.GetChain(task):
+        print("  %s" % graph.Describe(node))
+
+class TraceSwitches(gdb.Command):
+  """ Record the context switches without stopping the target
+      freertos trace start [--in|--out] [location] [capacity]
+      freertos trace stop
+      freertos trace dump [file]
+      The default location is vTaskSwitchContext, where pxCurrentTCB is
+      the task switched out (--out, the default). Use --in for a location
+      called once the task is switched in (i.e. from traceTASK_SWITCHED_IN)
+      start first runs the target briefly without the breakpoint to
+      measure the overhead of each hit
+  """
+  def __init__(self):
+    super(TraceSwitches, self).__init__(
+      "freertos trace",
+      gdb.COMMAND_SUPPORT
+      )
+
+  def invoke(self, arg, from_tty):
+    import Trace
+    argv = gdb.string_to_argv(arg)
+    if ( len(argv) == 0 or argv[0] not in ("start", "stop", "dump") ):
+      print("Usage: freertos trace start [--in|--out] [location] [capacity] | stop | dump [file]")
+      return
+    recorder = Trace.GetRecorder()
+    if ( argv[0] == "start" ):
+      if ( recorder is not None and recorder.IsRunning() ):
+        print("Trace already running")
+        return
+      incoming = False
+      params = []
+      for a in argv[1:]:
+        if ( a == "--in" ):
+          incoming = True
+        elif ( a == "--out" ):
+          incoming = False
+        else:
+          params.append(a)
+      location = Trace.DEFAULT_LOCATION
+      capacity = 65536
+      if ( len(params) > 0 ):
+        location = params[0]
+      if ( len(params) > 1 ):
+        capacity = int(params[1], 0)
+      recorder = Trace.NewRecorder(location, capacity, incoming)
+      print("Calibrating, running %.1f s without tracing" % Trace.CALIBRATION_WINDOW)
+      recorder.Calibrate()
+      recorder.Start()
+      print("Tracing switches %s at %s, %d entries" % ("in" if incoming else "out", location, capacity))
+      return
+    if ( recorder is None ):
+      print("No trace, use freertos trace start")
+      return
+    if ( argv[0] == "stop" ):
+      recorder.Stop()
+      recorder.PrintSummary()
+      return
+    if ( len(argv) > 1 ):
+      nb = recorder.Write(argv[1])
+      print("%d switches written to %s" % (nb, argv[1]))
+    recorder.PrintSummary()
+
 class ShowHandleName(gdb.Command):
   """ Generate a print out of the handle by name 
   """
@@ -102,6 +264,7 @@ class ShowHandleName(gdb.Command):
 
 class ShowRegistry(gdb.Command):
   """ Generate a print out of the queue handle registry
+      --json prints the registry as a JSON list
   """
   def __init__(self):
     super(ShowRegistry, self).__init__(
@@ -110,7 +273,11 @@ class ShowRegistry(gdb.Command):
       )
     
   def invoke(self, arg, from_tty):
+    argv, asJson = SplitJsonFlag(gdb.string_to_argv(arg))
     reg = HandleRegistry()
+    if ( asJson ):
+      print(json.dumps(reg.GetRecords()))
+      return
     reg.PrintRegistry()
     
 
@@ -118,6 +285,7 @@ class ShowList(gdb.Command):
   """ Generate a print out of the elements in a list 
       passed to this command. User must pass a symbol that 
       will be looked up. 
+      --json prints the elements as a JSON list
   """
 
   def __init__(self):
@@ -128,7 +296,7 @@ class ShowList(gdb.Command):
       )
       
   def invoke(self, arg, from_tty):
-    argv = gdb.string_to_argv(arg)    
+    argv, asJson = SplitJsonFlag(gdb.string_to_argv(arg))
 
     CastTypeStr = None
     if ( len(argv) > 0):
@@ -141,5 +309,10 @@ class ShowList(gdb.Command):
     
     elems = listVal.GetElements( CastTypeStr )
 
+    if ( asJson ):
+      from Snapshot import ListRecord
+      print(json.dumps([ListRecord(elem) for elem in elems]))
+      return
+
     for  elem in elems :
       print("Elem: %s" % str(elem))
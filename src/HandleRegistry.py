@@ -45,6 +45,19 @@ class HandleRegistry:
         name = elem['pcQueueName'].string()
         print("%d: %3s %16s" % (i, h, name))
 
+  def GetRecords(self):
+    """ Return the used entries as a list of dictionaries
+    """
+    resp = []
+    for i in range(self._minIndex, self._maxIndex):
+      elem = self._registry[i]
+      h = elem['xHandle']
+      if ( h != 0 ):
+        resp.append( { "index" : i, 
+                       "handle" : int(h.cast(StdTypes.uint32_t)), 
+                       "name" : elem['pcQueueName'].string() } )
+    return(resp)
+
   def FilterBy(self, qMode): 
 
     """ Retrieve a List of Mutex Queue Handles 
@@ -64,7 +77,7 @@ class HandleRegistry:
               resp.append(q)
               
           else: 
-            print("qType == None")
+            gdb.write("qType == None\n", gdb.STDERR)
         else: 
           resp.append(q)
 
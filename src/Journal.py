@@ -0,0 +1,158 @@
+# File: Journal.py
+#
+# Description:
+#   This file contains the journal of the changes made on the target
+# by switchTCB. The original bytes of every written location and the
+# original CPU registers of each thread are kept, the first time they
+# are touched, so that everything can be put back in one go before
+# resuming.
+#
+#   gdb.events.cont is only emitted once the target runs again, too
+# late to restore anything. The restore is done by gdb pre-hooks
+# (hook-continue, hook-step...) calling switchTCB --restore, installed
+# the first time the journal is used. A hook already defined by the
+# user is left alone, the cont event then only warns.
+#
+
+import gdb
+import os
+import tempfile
+
+# Commands resuming the target
+ResumeCommands = ["continue", "step", "next", "stepi", "nexti", "finish", "until", "advance", "jump"]
+
+class SwitchJournal:
+  """ Original memory content and registers, before any switchTCB
+  """
+  def __init__(self):
+    self._memory = {}       # address => original byte
+    self._registers = {}    # thread number => (thread, aRegisters)
+    self._hooksInstalled = False
+    self._missingHooks = []
+    self._watching = False
+
+  def IsEmpty(self):
+    return( len(self._memory) == 0 and len(self._registers) == 0 )
+
+  def _userHookExists(self, name):
+    try:
+      out = gdb.execute("show user " + name, to_string = True)
+    except gdb.error:
+      return(False)
+    return( len(out.strip()) > 0 )
+
+  def _installHooks(self):
+    """ Define hook-<command> for the resuming commands, through a
+        sourced file so it works with any gdb version
+    """
+    if ( self._hooksInstalled ):
+      return
+    self._hooksInstalled = True
+    script = ""
+    for command in ResumeCommands:
+      name = "hook-" + command
+      if ( self._userHookExists(name) ):
+        self._missingHooks.append(command)
+        continue
+      script += "define %s\n  switchTCB --restore\nend\n" % name
+    fd, path = tempfile.mkstemp(suffix = ".gdb")
+    try:
+      with os.fdopen(fd, "w") as f:
+        f.write(script)
+      gdb.execute("source " + path, to_string = True)
+    finally:
+      os.remove(path)
+    if ( len(self._missingHooks) > 0 ):
+      print("switchTCB: user hooks already defined for %s, use switchTCB --restore before them" % ", ".join(self._missingHooks))
+
+  def _watch(self):
+    self._installHooks()
+    if ( not self._watching ):
+      gdb.events.cont.connect(self._onContinue)
+      self._watching = True
+
+  def _unwatch(self):
+    if ( self._watching ):
+      gdb.events.cont.disconnect(self._onContinue)
+      self._watching = False
+
+  def RecordMemory(self, address, size):
+    """ Save the original content of [address, address+size[ unless
+        it is already in the journal
+    """
+    address = int(address)
+    data = bytearray(gdb.selected_inferior().read_memory(address, size))
+    for i in range(0, size):
+      if ( address + i not in self._memory ):
+        self._memory[address + i] = data[i]
+    self._watch()
+
+  def RecordRegisters(self, regs):
+    """ Save the CPU registers (aRegisters object, FPU included) of the
+        selected thread, only the first ones of each thread are kept
+    """
+    thread = gdb.selected_thread()
+    if ( thread.num not in self._registers ):
+      self._registers[thread.num] = (thread, regs)
+    self._watch()
+
+  def _runs(self):
+    """ Coalesce the journal into (address, bytes) contiguous runs
+    """
+    runs = []
+    start = None
+    data = bytearray()
+    for address in sorted(self._memory.keys()):
+      if ( start is not None and address == start + len(data) ):
+        data.append(self._memory[address])
+      else:
+        if ( start is not None ):
+          runs.append( (start, bytes(data)) )
+        start = address
+        data = bytearray([self._memory[address]])
+    if ( start is not None ):
+      runs.append( (start, bytes(data)) )
+    return(runs)
+
+  def Restore(self):
+    """ Put back the original registers of each thread, then the
+        original memory, one write per contiguous run
+    """
+    selected = gdb.selected_thread()
+    try:
+      for num, (thread, regs) in sorted(self._registers.items()):
+        if ( thread.is_valid() ):
+          thread.switch()
+          # switch() keeps the frame selected with up / down when the
+          # thread is already the current one, set $rN would write the
+          # saved registers of that frame instead of the CPU ones
+          gdb.newest_frame().select()
+          regs.setCPURegisters()
+    finally:
+      if ( selected is not None and selected.is_valid() ):
+        selected.switch()
+    inferior = gdb.selected_inferior()
+    runs = self._runs()
+    for address, data in runs:
+      inferior.write_memory(address, data)
+    self.Clear()
+    return(len(runs))
+
+  def Clear(self):
+    self._memory = {}
+    self._registers = {}
+    self._unwatch()
+
+  def _onContinue(self, event):
+    # The target already runs, writing now would restore the memory
+    # without the registers, so nothing is written
+    if ( not self.IsEmpty() ):
+      print("switchTCB: target resumed without restoring the original context, it is lost")
+      self.Clear()
+
+_journal = SwitchJournal()
+
+def GetJournal():
+  """ The journal of the gdb session
+  """
+  return(_journal)
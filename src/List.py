@@ -10,13 +10,13 @@
 
 import gdb 
 
-from Types import StdTypes
+from Types import StdTypes, LazyType, LookupType
 
 class ListInspector: 
   """ FreeRTOS List Inspector Object
   """ 
 
-  ListType = gdb.lookup_type("List_t")
+  ListType = LazyType("List_t")
 
   def __init__(self, handle ): 
     """
@@ -65,8 +65,8 @@ class ListInspector:
       if ( CastTypeStr != None):
         if( type(CastTypeStr) == str ):
           try:
-            CastType = gdb.lookup_type(CastTypeStr).pointer()
-          except:
+            CastType = LookupType(CastTypeStr).pointer()
+          except gdb.GdbError:
             print("Failed to find type: %s" % CastTypeStr)
         elif ( type(CastTypeStr) == gdb.Type): 
           CastType = CastTypeStr.pointer()
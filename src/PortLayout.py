@@ -0,0 +1,138 @@
+# File: PortLayout.py
+#
+# Description:
+#   This file contains the description of the frames stacked by the
+# FreeRTOS ARM ports when a task is switched out. Each layout is a
+# table of register names in stack order (lowest address first), the
+# word offset of each register is precomputed once so a frame is
+# decoded from bulk reads without any per field logic.
+#
+# On FPU ports the layout is chosen per task from the EXC_RETURN word
+# saved by PendSV : bit 4 cleared means the extended (FPU) frame.
+#
+
+import gdb
+import struct
+
+_HW_FRAME = ["r0", "r1", "r2", "r3", "r12", "lr", "pc", "xpsr"]
+_HW_FPU_FRAME = ["s%d" % i for i in range(0, 16)] + ["fpscr", "reserved"]
+_R4_R11 = ["r%d" % i for i in range(4, 12)]
+_S16_S31 = ["s%d" % i for i in range(16, 32)]
+
+EXC_RETURN_FTYPE = 0x10          # cleared => extended frame
+
+class FrameLayout:
+  """ One stacked frame layout
+  """
+  def __init__(self, name, words):
+    self.name = name
+    self.words = words
+    self.size = len(words)
+    self.offsets = dict( (w, i) for i, w in enumerate(words) )
+    self._format = "<%dI" % self.size
+
+  def Decode(self, data):
+    """ Return a dictionary register => value
+    """
+    return( dict(zip(self.words, struct.unpack_from(self._format, data))) )
+
+  def Encode(self, values):
+    """ Build the raw frame from a dictionary register => value,
+        missing registers are 0
+    """
+    return( struct.pack(self._format, *[values.get(w, 0) & 0xffffffff for w in self.words]) )
+
+class PortDescription:
+  """ Frame layouts of a port
+      @param basic layout without FPU context
+      @param extended layout with FPU context, None if the port has no FPU
+      @param excReturn EXC_RETURN stacked with a basic frame by the port
+        (portINITIAL_EXC_RETURN), None if the port does not stack it
+  """
+  def __init__(self, name, basic, extended = None, excReturn = None):
+    self.name = name
+    self.basic = basic
+    self.extended = extended
+    self.excReturn = excReturn
+    self._excReturn = None
+    if ( extended is not None ):
+      self._excReturn = basic.offsets["exc_return"]
+
+  def SelectLayout(self, rawWords):
+    """ Pick the layout from the EXC_RETURN word, rawWords being the
+        frame as a tuple of words
+    """
+    if ( self._excReturn is None ):
+      return(self.basic)
+    if ( rawWords[self._excReturn] & EXC_RETURN_FTYPE ):
+      return(self.basic)
+    return(self.extended)
+
+  def ReadFrame(self, address):
+    """ Read and decode the frame at address, sized to its layout: one
+        read for a basic frame, a second one for the rest of an extended
+        frame (both layouts start with the same words up to EXC_RETURN)
+        Return (layout, dictionary register => value)
+    """
+    inferior = gdb.selected_inferior()
+    data = bytes(inferior.read_memory(address, 4 * self.basic.size))
+    words = struct.unpack_from("<%dI" % self.basic.size, data)
+    layout = self.SelectLayout(words)
+    if ( layout is not self.basic ):
+      data += bytes(inferior.read_memory(address + len(data), 4 * (layout.size - self.basic.size)))
+    return( (layout, layout.Decode(data)) )
+
+# ARM_CM0 / ARM_CM3 / ARM_CM4 without FPU
+_CM3 = PortDescription("CM3",
+          FrameLayout("CM3", _R4_R11 + _HW_FRAME))
+
+# ARM_CM4F / ARM_CM7
+_CM4F = PortDescription("CM4F",
+          FrameLayout("CM4F", _R4_R11 + ["exc_return"] + _HW_FRAME),
+          FrameLayout("CM4F-FPU", _R4_R11 + ["exc_return"] + _S16_S31 + _HW_FRAME + _HW_FPU_FRAME),
+          0xfffffffd)   # thread mode, PSP, basic frame
+
+# ARM_CM33_NTZ / ARM_CM23_NTZ (non TrustZone, no MPU)
+_CM33 = PortDescription("CM33",
+          FrameLayout("CM33", ["psplim", "exc_return"] + _R4_R11 + _HW_FRAME),
+          FrameLayout("CM33-FPU", ["psplim", "exc_return"] + _R4_R11 + _S16_S31 + _HW_FRAME + _HW_FPU_FRAME),
+          0xffffffbc)   # non secure, thread mode, PSP, basic frame
+
+Ports = {
+  "CM0" : _CM3,
+  "CM3" : _CM3,
+  "CM4" : _CM3,
+  "CM4F" : _CM4F,
+  "CM7" : _CM4F,
+  "CM33" : _CM33,
+  "CM23" : _CM33,
+  }
+
+_selectedPort = None
+
+def _hasRegister(name):
+  try:
+    gdb.selected_frame().read_register(name)
+    return(True)
+  except (ValueError, gdb.error):
+    return(False)
+
+def SetPort(name):
+  """ Force the port, name being one of Ports
+  """
+  global _selectedPort
+  _selectedPort = Ports[name.upper()]
+
+def GetPort():
+  """ Return the port selected with SetPort, or guess it from the
+      registers the target exposes
+  """
+  global _selectedPort
+  if ( _selectedPort is None ):
+    if ( _hasRegister("psplim") ):
+      _selectedPort = _CM33
+    elif ( _hasRegister("fpscr") ):
+      _selectedPort = _CM4F
+    else:
+      _selectedPort = _CM3
+  return(_selectedPort)
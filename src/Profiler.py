@@ -0,0 +1,164 @@
+# File: Profiler.py
+#
+# Description:
+#   This file contains a sampling profiler that attributes the CPU
+# time to the FreeRTOS tasks. The target is interrupted at a fixed
+# rate, the current TCB(s) and the PC are read, and the target is resumed
+# right away. Everything else (task names, symbols) is resolved once
+# the sampling is over so that each sample costs as little probe
+# traffic as possible.
+#
+
+import gdb
+import os
+import signal
+import threading
+import time
+
+from Task import TaskInspector
+from Smp import CoreMap
+
+class TaskProfiler:
+  """ Sample pxCurrentTCB + PC and build per task / per function
+      histograms
+  """
+  def __init__(self, symbolLookup):
+    """
+        @param symbolLookup function converting a PC into a function name
+    """
+    self._symbolLookup = symbolLookup
+    self._cores = CoreMap()
+    self._samples = {}   # (tcb,pc) => count
+    self._nbSamples = 0
+    self._period = 0
+    self._frequency = 0
+    self._elapsed = 0.0
+    self._lastStop = None
+    self._timer = None
+    self._fired = False
+
+  #
+  # Ask gdb to interrupt the target, exactly like ctrl-c. The flag tells
+  # our interrupt from a ctrl-c of the user, both are SIGINT stops
+  #
+  def _interrupt(self):
+    self._fired = True
+    os.kill(os.getpid(), signal.SIGINT)
+
+  def _onContinue(self, event):
+    self._cancelTimer()
+    self._fired = False
+    self._timer = threading.Timer(self._period, self._interrupt)
+    self._timer.daemon = True
+    self._timer.start()
+
+  def _cancelTimer(self):
+    if ( self._timer is not None ):
+      self._timer.cancel()
+      self._timer = None
+
+  def _isOurInterrupt(self, event):
+    return( self._fired and isinstance(event, gdb.SignalEvent) and event.stop_signal == "SIGINT" )
+
+  def _onStop(self, event):
+    self._lastStop = event
+
+  def Sample(self, duration, frequency):
+    """ Run the target for duration seconds, sampling it frequency
+        times per second
+    """
+    self._period = 1.0 / frequency
+    self._frequency = frequency
+    threads = self._cores.GetThreads()
+    gdb.events.cont.connect(self._onContinue)
+    gdb.events.stop.connect(self._onStop)
+    start = time.time()
+    try:
+      end = start + duration
+      while time.time() < end:
+        self._lastStop = None
+        try:
+          gdb.execute("continue", to_string = True)
+        except (KeyboardInterrupt, gdb.error):
+          break
+        # Stopped by something else than our interrupt (ctrl-c, breakpoint, fault, exit...)
+        if ( not self._isOurInterrupt(self._lastStop) ):
+          print("Target stopped, profiling aborted")
+          break
+        # Only one read on the target per sample, the PC comes with the stop
+        tcbs = self._cores.ReadCurrentTCBs()
+        tcb = tcbs[self._cores.GetSelectedCore(threads)]
+        pc = int(gdb.selected_frame().pc())
+        key = (tcb, pc)
+        self._samples[key] = self._samples.get(key, 0) + 1
+        self._nbSamples += 1
+    finally:
+      self._elapsed = time.time() - start
+      gdb.events.cont.disconnect(self._onContinue)
+      self._cancelTimer()
+      gdb.events.stop.disconnect(self._onStop)
+    return(self._nbSamples)
+
+  #
+  # Post processing, done once sampling is over
+  #
+  def _taskName(self, tcb, cache):
+    if ( tcb not in cache ):
+      try:
+        tcbObj = gdb.Value(tcb).cast(TaskInspector.TCBType.pointer())
+        cache[tcb] = TaskInspector(tcbObj.dereference()).GetName()
+      except Exception:
+        cache[tcb] = "0x%08x" % tcb
+    return(cache[tcb])
+
+  def _functionName(self, pc, cache):
+    if ( pc not in cache ):
+      cache[pc] = self._symbolLookup(pc)
+    return(cache[pc])
+
+  def GetHistograms(self):
+    """ Return (perTask, perFunction, perTaskFunction) dictionaries
+        name => sample count
+    """
+    names = {}
+    symbols = {}
+    perTask = {}
+    perFunction = {}
+    perTaskFunction = {}
+    for (tcb, pc), count in self._samples.items():
+      task = self._taskName(tcb, names)
+      func = self._functionName(pc, symbols)
+      perTask[task] = perTask.get(task, 0) + count
+      perFunction[func] = perFunction.get(func, 0) + count
+      key = (task, func)
+      perTaskFunction[key] = perTaskFunction.get(key, 0) + count
+    return(perTask, perFunction, perTaskFunction)
+
+  def PrintReport(self):
+    if ( self._nbSamples == 0 ):
+      print("No samples")
+      return
+    perTask, perFunction, perTaskFunction = self.GetHistograms()
+    total = float(self._nbSamples)
+    # The timer is armed on resume, each sample round trip comes on top
+    # of the period so the achieved rate is lower than the requested one
+    achieved = 0.0
+    if ( self._elapsed > 0 ):
+      achieved = self._nbSamples / self._elapsed
+    print("Samples: %d in %.1f s, %.1f Hz achieved (%.1f Hz requested)" % (self._nbSamples, self._elapsed, achieved, self._frequency))
+    print("%16s %8s %6s" % ("TASK", "SAMPLES", "%"))
+    for name, count in sorted(perTask.items(), key = lambda e: -e[1]):
+      print("%16s %8d %6.2f" % (name, count, 100.0 * count / total))
+    print("")
+    print("%32s %8s %6s" % ("FUNCTION", "SAMPLES", "%"))
+    for name, count in sorted(perFunction.items(), key = lambda e: -e[1]):
+      print("%32s %8d %6.2f" % (name, count, 100.0 * count / total))
+
+  def WriteCollapsed(self, fileName):
+    """ Write the samples in the collapsed stack format used by
+        flamegraph.pl i.e. task;function count
+    """
+    perTask, perFunction, perTaskFunction = self.GetHistograms()
+    with open(fileName, "w") as f:
+      for (task, func), count in sorted(perTaskFunction.items()):
+        f.write("%s;%s %d\n" % (task.replace(" ", "_"), func, count))
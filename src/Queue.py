@@ -10,6 +10,7 @@
 import gdb 
 from List import ListInspector
 from Task import TaskInspector
+from Types import LazyType
 
 
 class QueueMode:
@@ -46,7 +47,7 @@ QueueMode.Map = QueueMap
 
 class QueueInspector: 
 
-  QueueType = gdb.lookup_type("Queue_t")
+  QueueType = LazyType("Queue_t")
 
   def __init__(self, handle): 
     """
@@ -85,6 +86,32 @@ class QueueInspector:
     rxList = ListInspector( self._queue['xTasksWaitingToReceive'] )
     return( rxList.GetElements( TaskInspector.TCBType) )
 
+  def GetAddress(self):
+    """ Return the address of the queue object as an int
+    """
+    return( int(self._queue.address) )
+
+  def IsMutex(self):
+    """ Mutexes are queues with a NULL pcHead (queueQUEUE_IS_MUTEX)
+    """
+    return( int(self._queue['pcHead']) == 0 )
+
+  def GetMutexHolder(self):
+    """ Return the TCB pointer of the task holding this mutex, 
+        None if it is not a mutex or if it is not taken
+    """
+    if ( not self.IsMutex() ):
+      return(None)
+    try:
+      # FreeRTOS 10.2+
+      holder = self._queue['u']['xSemaphore']['xMutexHolder']
+    except gdb.error:
+      # Older kernels : #define pxMutexHolder pcTail
+      holder = self._queue['pcTail']
+    if ( int(holder) == 0 ):
+      return(None)
+    return( holder.cast(TaskInspector.TCBType.pointer()) )
+
   def GetQueueMessagesWaiting(self):
     """ Return the number of messages waiting as a 
         L{gdb.Value} object
@@ -106,7 +133,7 @@ class QueueInspector:
       # If the TRACE functionality of the RTOS is not enabled, 
       #  then the queue type will not be availabe in the queue 
       #  handle - so we return None 
-      print("Failed to get Type: %s" % str(exc))
+      gdb.write("Failed to get Type: %s\n" % str(exc), gdb.STDERR)
       return(None)
       
     
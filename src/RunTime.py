@@ -0,0 +1,133 @@
+# File: RunTime.py
+#
+# Description:
+#   This file contains the implementation of the run time statistics
+# reader. When configGENERATE_RUN_TIME_STATS is set, each TCB holds
+# ulRunTimeCounter and the kernel keeps ulTotalRunTime. The counters
+# of the previous halt are kept for the whole gdb session so that the
+# CPU share can be computed since boot and since the last halt. The
+# deltas are computed modulo the counter size so a 32 bit wrap (about
+# 71 minutes at 1 MHz) is handled. The snapshot is dropped when the
+# counters go backwards in a way a wrap cannot explain (target reset).
+#
+
+import gdb
+import struct
+
+from Task import TaskInspector
+
+# Per session snapshots, (halt, total, tcb => counter)
+# _current is the one taken during the current halt, _previous the one
+# of an earlier halt, used as the base for the deltas
+_current = None
+_previous = None
+_halt = 0
+
+def _onStop(event):
+  global _halt
+  _halt += 1
+
+def _onExit(event):
+  global _current, _previous
+  _current = None
+  _previous = None
+
+gdb.events.stop.connect(_onStop)
+gdb.events.exited.connect(_onExit)
+
+class RunTimeInspector:
+  """ Read ulRunTimeCounter for a set of TCBs + the total run time
+  """
+  def __init__(self, totalSymbol = "ulTotalRunTime"):
+    field = None
+    for f in TaskInspector.TCBType.fields():
+      if ( f.name == "ulRunTimeCounter" ):
+        field = f
+    if ( field is None ):
+      raise ValueError("ulRunTimeCounter not in TCB_t, is configGENERATE_RUN_TIME_STATS set?")
+    self._offset = field.bitpos // 8
+    self._size = field.type.sizeof
+    self._format = "<Q" if self._size == 8 else "<I"
+    self._totalSymbol = totalSymbol
+    self._counterModulus = 1 << (8 * self._size)
+    self._totalModulus = self._counterModulus
+
+  def _readCounter(self, inferior, tcb):
+    data = inferior.read_memory(tcb + self._offset, self._size)
+    return(struct.unpack(self._format, data)[0])
+
+  def _readTotal(self):
+    total = gdb.parse_and_eval(self._totalSymbol)
+    if ( total.type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY ):
+      # SMP kernels keep one total per core
+      minIndex, maxIndex = total.type.range()
+      self._totalModulus = 1 << (8 * total[minIndex].type.sizeof)
+      return(sum([int(total[i]) for i in range(minIndex, maxIndex+1)]))
+    self._totalModulus = 1 << (8 * total.type.sizeof)
+    return(int(total))
+
+  def _delta(self, now, before, modulus):
+    return( (now - before) % modulus )
+
+  def _getBase(self, total, counters):
+    """ Return the snapshot of the previous halt to compute the deltas
+        from, None if there is none or if the target was reset since
+    """
+    global _current, _previous
+    if ( _current is not None and _current[0] != _halt ):
+      _previous = _current
+    _current = (_halt, total, counters)
+    if ( _previous is None ):
+      return(None)
+    # A wrap keeps the (modular) task deltas within the total delta, a
+    # reset makes them huge. The base is useless after a reset
+    deltaTotal = self._delta(total, _previous[1], self._totalModulus)
+    deltaTasks = 0
+    common = 0
+    for tcb, counter in counters.items():
+      if ( tcb in _previous[2] ):
+        common += 1
+      deltaTasks += self._delta(counter, _previous[2].get(tcb, 0), self._counterModulus)
+    if ( deltaTasks > deltaTotal or common == 0 ):
+      print("Run time counters went backwards (target reset?), deltas restart from boot")
+      _previous = None
+      return(None)
+    return(_previous)
+
+  def GetStats(self, tasks):
+    """ tasks is a list of (tcb address, name)
+        Return a list of (tcb, name, counter, boot %, delta, delta %)
+        sorted by load since the previous halt. Calling it again during
+        the same halt gives the same deltas
+    """
+    # TCBs are allocated separately, each counter needs its own read,
+    # only the fields we need are read
+    inferior = gdb.selected_inferior()
+    counters = {}
+    for tcb, name in tasks:
+      counters[tcb] = self._readCounter(inferior, tcb)
+    total = self._readTotal()
+
+    base = self._getBase(total, counters)
+    if ( base is None ):
+      deltaTotal = total
+    else:
+      deltaTotal = self._delta(total, base[1], self._totalModulus)
+
+    resp = []
+    for tcb, name in tasks:
+      counter = counters[tcb]
+      previous = 0
+      if ( base is not None ):
+        previous = base[2].get(tcb, 0)
+      delta = self._delta(counter, previous, self._counterModulus)
+      bootPercent = 0.0
+      if ( total > 0 ):
+        bootPercent = 100.0 * counter / total
+      deltaPercent = 0.0
+      if ( deltaTotal > 0 ):
+        deltaPercent = 100.0 * delta / deltaTotal
+      resp.append( (tcb, name, counter, bootPercent, delta, deltaPercent) )
+
+    resp.sort(key = lambda e: (-e[5], -e[3]))
+    return(resp)
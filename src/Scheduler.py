@@ -0,0 +1,261 @@
+# File: Scheduler.py
+#
+# Description:
+#   This file contains the Scheduler class, the view of the kernel
+# task lists used by the commands of FreeRTOS.py. It lives in its own
+# module so it can be imported by scripts without registering the
+# commands.
+#
+
+import gdb
+from List import ListInspector 
+from Smp import CoreMap
+from Journal import GetJournal
+from TaskFilter import TaskFilter
+from ArmRegisters import aRegisters
+
+#
+# Helper class to deal with registers
+#    
+class Scheduler:
+  
+  def __init__(self, taskFilter=None):
+    self.allTasks = [] 
+    if(taskFilter is None):
+        taskFilter=TaskFilter()
+    self._filter = taskFilter
+    # Only there with INCLUDE_vTaskSuspend
+    self._blocked = self.optionalList("xSuspendedTaskList")
+    self._delayed1 = ListInspector("xDelayedTaskList1")
+    self._delayed2 = ListInspector("xDelayedTaskList2")
+    self._readyLists = []
+    readyTasksListsStr = "pxReadyTasksLists"
+    # Current TCB, one per core on SMP kernels, read in one go
+    self._cores = CoreMap()
+    self._currentTCBs = self._cores.ReadCurrentTCBs()
+    self._threads = self._cores.GetThreads()
+    self._selectedCore = self._cores.GetSelectedCore(self._threads)
+    self._currentTCBv = self._currentTCBs[self._selectedCore]
+    self._currentTCBAddress = self._cores.GetCurrentTCBAddress(self._selectedCore)
+     # Ready 
+    readyListsSym,methodType = gdb.lookup_symbol(readyTasksListsStr)
+    if ( readyListsSym != None ): 
+      readyLists = readyListsSym.value()
+      minIndex, maxIndex = readyLists.type.range()
+      for i in range(minIndex, maxIndex+1):
+        readyList = readyLists[i]
+        FRReadyList = ListInspector( readyList )
+        self._readyLists.append(FRReadyList)
+      self.getTasks()
+    else: 
+      print("Failed to Find Symbol: %s" % readyTasksListsStr)
+      raise ValueError("Invalid Symbol!")
+
+  # List inspector for a symbol that may not be in the image
+  def optionalList(self,symbolName):
+    symbol,methodType=gdb.lookup_symbol(symbolName)
+    if(symbol is None):
+        return None
+    return ListInspector(symbol.value())
+
+  # sort by TCB
+  def sortTCB(self,e):
+    return e[0]
+#
+# Return the core running the given TCB, None if not running
+#
+  def getCoreOf(self,tcbPointer):
+    for core,tcb in enumerate(self._currentTCBs):
+        if(tcb == int(tcbPointer)):
+            return core
+    return None
+
+  def coreTag(self,core):
+    if(self._cores.IsSmp()):
+        return "*%d" % core
+    return "*"
+#
+# dump the tasks
+#
+  def ShowTaskList(self): 
+     # dump them, filtered lists have no index (see getTasks)
+    for t in self.allTasks:
+        dex="-"
+        if(t[3] is not None):
+            dex="%d" % t[3]
+        tcbPointer=t[0]
+        status=t[1]
+        tcbContent=t[2]
+        core=self.getCoreOf(tcbPointer)
+        # Current Task, info on the stack are irrelevant
+        if(core == self._selectedCore):
+            current=self.coreTag(core)
+            print("%s %s TCB: 0x%08x Name:%12s " % (dex,current, tcbPointer,tcbContent['pcTaskName'].string()))
+        elif(core is not None):
+            # Running on another core, the stack is stale, ask the core
+            current=self.coreTag(core)
+            print("%s %s TCB: 0x%08x Name:%12s State:Run%d" % (dex,current, tcbPointer,tcbContent['pcTaskName'].string(), core))
+            if(self._threads is not None):
+                LR,PC,SP=self._cores.ReadLiveRegisters(core,self._threads)
+                print("\t\t LR=0x%x PC=0x%x SP=0x%x function=%s" % (LR, PC, SP,self.GetSymbolForAddress(PC)))
+        else:
+            if(self._cores.IsSmp()):
+                current="  "
+            else:
+                current=" "
+            stack=tcbContent['pxTopOfStack']
+            where=""
+            print("%s %s TCB: 0x%08x Name:%12s State:%s TopOfStack:0x%08x" % (dex, current, tcbPointer,tcbContent['pcTaskName'].string(), status, stack))
+            self.getAdditionInfo(stack)
+#
+# Get a list of created tasks + some properties
+#
+  def getTasks(self): 
+    taskFilter=self._filter
+    if(taskFilter.WantsState("Ready ")):
+      for i,rlist in enumerate(self._readyLists):
+        if i == 0:
+          items = rlist.GetElements( "TCB_t", 0 )
+        else: 
+          items = rlist.GetElements( "TCB_t", 1 )
+        self.addTasks(items,"Ready ")
+
+    if(self._blocked is not None and taskFilter.WantsState("Blked ")):
+      self.addTasks(self._blocked.GetElements("TCB_t"),"Blked ")
+
+    if(taskFilter.WantsState("Delay1")):
+      self.addTasks(self._delayed1.GetElements("TCB_t"),"Delay1")
+      self.addTasks(self._delayed2.GetElements("TCB_t"),"Delay1")
+
+    self.allTasks.sort(key=self.sortTCB)
+    # [3] => index for switchTCB, only known when all the tasks are there
+    if(taskFilter.IsEmpty()):
+      for dex,t in enumerate(self.allTasks):
+        t[3]=dex
+#
+# Append the tasks of a kernel list passing the filter
+#
+  def addTasks(self,items,status):
+    for tcb,val,ptr in items:
+      ## print(tcb, tcb.type.name, val, val.type.name)
+      if(self._filter.IsEmpty() or (self._filter.MatchesState(status,int(ptr)) and self._filter.Matches(int(ptr)))):
+        tem = [ptr,status,tcb,None]
+        self.allTasks.append(tem)
+#
+#
+#
+  @staticmethod
+  def GetSymbolForAddress(adr):
+     try:
+        block = gdb.block_for_pc(adr)
+        while block and not block.function:
+           block = block.superblock
+        return block.function.print_name
+     except:
+       # No debug info (vendor library, ROM), stay quiet, this is also
+       # used by the JSON output
+       return "???"
+#
+#
+#
+  def getAdditionInfo(self, topStack):
+    # Now retrieve actual stack pointer, PC and LR
+    # The layout of the frame depends on the port, see PortLayout
+    # It is read with a read sized to the layout
+    regs=aRegisters()
+    regs.loadRegistersFromMemory(topStack)
+    LR=regs.reg[14]
+    PC=regs.reg[15]
+    # This is the address of the user stack, i.e. after the registers saved by FreeRTOS
+    actualStack=regs.reg[13]
+    print("\t\t LR=0x%x PC=0x%x SP=0x%x function=%s" % (LR, PC, actualStack,self.GetSymbolForAddress(PC)))
+#
+# Return the registers of a task as an aRegisters object
+# live ones for running tasks, the stacked frame for the others
+#
+  def getTaskRegisters(self,t):
+    regs=aRegisters()
+    core=self.getCoreOf(t[0])
+    if(core is None):
+        regs.loadRegistersFromMemory(t[2]['pxTopOfStack'])
+    elif(core == self._selectedCore):
+        regs.getCPURegisters()
+    elif(self._threads is None):
+        # No gdb thread for that core, do not give it the registers of
+        # the selected core. Its stacked frame is stale but still its own
+        gdb.write("Warning: no gdb thread for core %d, using the stale stacked frame of %s\n" % (core,t[2]['pcTaskName'].string()),gdb.STDERR)
+        regs.loadRegistersFromMemory(t[2]['pxTopOfStack'])
+    else:
+        selected=gdb.selected_thread()
+        self._threads[core].switch()
+        try:
+            regs.getCPURegisters()
+        finally:
+            selected.switch()
+    return regs
+#
+#
+#
+  def switchTCB(self,task):
+    print("switch TCB %d " % task)
+    # Dereference address to get stack
+    if(task>=len(self.allTasks)):
+        print("out of range")
+        return
+
+    core=self.getCoreOf(self.allTasks[task][0])
+    if(core is not None and core != self._selectedCore):
+        # Running on another core, its registers are live there
+        if(self._threads is None):
+            print("Cannot find the gdb thread of core %d" % core)
+            return
+        print("Task running on core %d, selecting its thread" % core)
+        self._threads[core].switch()
+        return
+    # set $rN writes the selected frame, after up / down it is an outer
+    # frame, go back to the innermost one to reach the CPU registers
+    gdb.newest_frame().select()
+    # First save the current task
+    old=aRegisters()
+    old.getCPURegisters()
+    found=None
+    # Search the current TCB
+    for t in self.allTasks:
+        if(t[0]==self._currentTCBv):
+            # got it
+            found=t[2]
+    if( found is None):
+        print("Cannot locate current TCB")
+        return
+    t=self.allTasks[task]
+    # [0] => TCB pointer
+    # [1] => State
+    # [2] => TCB structure
+    # [3] => index, None when filtered
+    if(t[0]==self._currentTCBv):
+        print("task already selected")
+        return
+    #
+    # Rewind by the size of the port frame (64 bytes / 16 registers on M0/M3)
+    sp=old.reg[13]
+    sp-=old.FrameSize()
+    # Keep what we are about to overwrite, see switchTCB --restore
+    journal=GetJournal()
+    journal.RecordRegisters(old)
+    journal.RecordMemory(sp,old.FrameSize())
+    journal.RecordMemory(self._currentTCBv,4)
+    journal.RecordMemory(self._currentTCBAddress,4)
+    # store them
+    old.saveRegisterToMemory(sp) 
+    # update xtopStack with new value
+    old.write32bits(self._currentTCBv,sp)
+    tcbContent=t[2]
+    stack=tcbContent['pxTopOfStack']
+    # 1-load registers
+    regs=aRegisters()
+    regs.loadRegistersFromMemory(stack) # regs now contains the address
+    regs.setCPURegisters()   # set the actual registers
+
+    # update pxCurrentTCB
+    print("Updating current TCB to %x" % t[0])
+    regs.write32bits( self._currentTCBAddress,t[0]) 
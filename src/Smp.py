@@ -0,0 +1,74 @@
+# File: Smp.py
+#
+# Description:
+#   This file contains the mapping between the cores and the current
+# TCBs. Single core kernels have pxCurrentTCB, SMP kernels (FreeRTOS 11,
+# configNUMBER_OF_CORES > 1) have pxCurrentTCBs[configNUMBER_OF_CORES].
+# On SMP targets the probe exposes one gdb thread per core, core N
+# being the Nth thread.
+#
+
+import gdb
+import struct
+
+class CoreMap:
+  """ Locate the current TCB(s) and the gdb thread of each core
+  """
+  def __init__(self):
+    try:
+      tcbs = gdb.parse_and_eval("pxCurrentTCBs")
+      minIndex, maxIndex = tcbs.type.range()
+      self.nbCores = maxIndex - minIndex + 1
+      self.address = int(tcbs.address)
+    except gdb.error:
+      tcb = gdb.parse_and_eval("pxCurrentTCB")
+      self.nbCores = 1
+      self.address = int(tcb.address)
+
+  def IsSmp(self):
+    return( self.nbCores > 1 )
+
+  def GetCurrentTCBAddress(self, core):
+    """ Address of the pointer to the TCB running on core
+    """
+    return( self.address + 4 * core )
+
+  def ReadCurrentTCBs(self):
+    """ Read the TCB running on each core, in one go
+    """
+    data = gdb.selected_inferior().read_memory(self.address, 4 * self.nbCores)
+    return( list(struct.unpack("<%dI" % self.nbCores, data)) )
+
+  def GetThreads(self):
+    """ Return the gdb threads sorted by core, or None if they do
+        not map to the cores
+    """
+    threads = sorted(gdb.selected_inferior().threads(), key = lambda t: t.num)
+    if ( len(threads) != self.nbCores ):
+      return(None)
+    return(threads)
+
+  def GetSelectedCore(self, threads = None):
+    """ Return the core of the selected gdb thread
+    """
+    if ( threads is None ):
+      threads = self.GetThreads()
+    if ( threads is None ):
+      return(0)
+    selected = gdb.selected_thread()
+    for core, t in enumerate(threads):
+      if ( t.num == selected.num ):
+        return(core)
+    return(0)
+
+  def ReadLiveRegisters(self, core, threads):
+    """ Return (LR, PC, SP) of the given core, read from its gdb thread
+    """
+    selected = gdb.selected_thread()
+    threads[core].switch()
+    try:
+      frame = gdb.newest_frame()
+      regs = [int(frame.read_register(r)) & 0xffffffff for r in ("lr", "pc", "sp")]
+    finally:
+      selected.switch()
+    return(tuple(regs))
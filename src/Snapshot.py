@@ -0,0 +1,103 @@
+# File: Snapshot.py
+#
+# Description:
+#   This file contains the Python query API. A KernelSnapshot reads
+# the tasks, the queues and the handle registry once and returns them
+# as plain dictionaries / lists, ready to be dumped as JSON. It can be
+# used from a gdb python script :
+#
+#   import Snapshot
+#   Snapshot.KernelSnapshot().WriteJson(open("state.json", "w"))
+#
+
+import gdb
+import json
+
+from Scheduler import Scheduler
+from HandleRegistry import HandleRegistry
+from Task import TaskInspector
+
+def TaskRecord(sched, t):
+  """ Build the record of one task of a L{Scheduler}, index is the
+      switchTCB index, None when the task list is filtered
+  """
+  tcbContent = t[2]
+  core = sched.getCoreOf(t[0])
+  task = TaskInspector(tcbContent)
+  regs = sched.getTaskRegisters(t)
+  state = t[1].strip()
+  if ( core is not None ):
+    state = "Running"
+  return( {
+    "index" : t[3],
+    "tcb" : int(t[0]),
+    "name" : task.GetName(),
+    "state" : state,
+    "core" : core,
+    "priority" : int(task.GetPriority()),
+    "topOfStack" : int(tcbContent['pxTopOfStack']),
+    "stackMargin" : int(task.GetStackMargin()),
+    "pc" : regs.reg[15],
+    "lr" : regs.reg[14],
+    "sp" : regs.reg[13],
+    "function" : Scheduler.GetSymbolForAddress(regs.reg[15]),
+    } )
+
+def _waiterNames(waiters):
+  return( [TaskInspector(tcb).GetName() for tcb, val, ptr in waiters] )
+
+def QueueRecord(q):
+  """ Build the record of a L{QueueInspector}
+  """
+  holder = q.GetMutexHolder()
+  if ( holder is not None ):
+    holder = int(holder)
+  return( {
+    "handle" : q.GetAddress(),
+    "name" : q.GetName(),
+    "type" : "mutex" if q.IsMutex() else "queue",
+    "messagesWaiting" : int(q.GetQueueMessagesWaiting()),
+    "waitingToSend" : _waiterNames(q.GetTasksWaitingToSend()),
+    "waitingToReceive" : _waiterNames(q.GetTasksWaitingToReceive()),
+    "holder" : holder,
+    } )
+
+def ListRecord(elem):
+  """ Build the record of one element returned by ListInspector.GetElements
+  """
+  owner, val, ptr = elem
+  if ( owner.type.strip_typedefs().code == gdb.TYPE_CODE_STRUCT ):
+    owner = int(ptr)
+  else:
+    owner = int(owner)
+  return( { "owner" : owner, "value" : int(val) } )
+
+class KernelSnapshot:
+  """ Tasks, queues and registry read in one go
+  """
+  def __init__(self, taskFilter = None, withQueues = True):
+    sched = Scheduler(taskFilter)
+    self.tasks = [TaskRecord(sched, t) for t in sched.allTasks]
+    self.registry = []
+    self.queues = []
+    if ( withQueues ):
+      reg = HandleRegistry()
+      self.registry = reg.GetRecords()
+      self.queues = [QueueRecord(q) for q in reg.FilterBy(None)]
+
+  def ToDict(self):
+    return( {
+      "tasks" : self.tasks,
+      "queues" : self.queues,
+      "registry" : self.registry,
+      } )
+
+  def ToJson(self):
+    return( json.dumps(self.ToDict()) )
+
+  def WriteJson(self, stream):
+    """ Write the snapshot as one JSON line, so several snapshots can be
+        streamed to the same log
+    """
+    stream.write(self.ToJson() + "\n")
+    stream.flush()
@@ -8,10 +8,11 @@
 # 
 
 import gdb
+from Types import LazyType
 
 class TaskInspector:
 
-  TCBType = gdb.lookup_type("TCB_t")
+  TCBType = LazyType("TCB_t")
 
   def __init__(self, handle): 
     self._tcb = None
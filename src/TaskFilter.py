@@ -0,0 +1,183 @@
+# File: TaskFilter.py
+#
+# Description:
+#   This file contains the filters of show Task-List, i.e.
+#     state=Blocked name=net* prio>=5 stack<256
+#   The state filter tells which kernel lists need to be walked, the
+# other ones read only the TCB field they test (with one read each)
+# so that the tasks are discarded before being decoded.
+#   States follow eTaskGetState: a task in a delayed list is blocked,
+# a task in xSuspendedTaskList is blocked if its xEventListItem is in
+# an event list (waiting without timeout), suspended otherwise.
+#
+
+import gdb
+import fnmatch
+import operator
+import re
+import struct
+
+from Task import TaskInspector
+
+# state filter value => task states
+StateMap = {
+  "ready" : ["ready"],
+  "blocked" : ["delayed", "waiting"],
+  "blked" : ["delayed", "waiting"],
+  "suspended" : ["suspended"],
+  "delay" : ["delayed"],
+  "delayed" : ["delayed"],
+  }
+
+# labels used by Scheduler.getTasks => task states found in that list
+ListStates = {
+  "Ready " : ["ready"],
+  "Blked " : ["waiting", "suspended"],
+  "Delay1" : ["delayed"],
+  }
+
+_Operators = {
+  "=" : operator.eq,
+  "==" : operator.eq,
+  "!=" : operator.ne,
+  "<" : operator.lt,
+  "<=" : operator.le,
+  ">" : operator.gt,
+  ">=" : operator.ge,
+  }
+
+_FilterRe = re.compile(r"^(state|name|prio|stack)(==|!=|<=|>=|=|<|>)(.+)$")
+
+class TaskFilter:
+  """ Filters given as key<op>value strings, all of them must match
+      state : Ready, Blocked (alias Blked, delayed or waiting without
+              timeout), Suspended, Delayed
+      name  : glob pattern on pcTaskName
+      prio  : uxPriority
+      stack : free stack, in words, between pxStack and pxTopOfStack
+  """
+  def __init__(self, args = []):
+    self._states = None
+    self._excludedStates = []
+    self._names = []
+    self._priorities = []
+    self._stacks = []
+    self._fields = None
+    for a in args:
+      self._parse(a)
+
+  def _parse(self, arg):
+    m = _FilterRe.match(arg)
+    if ( m is None ):
+      raise ValueError("Invalid filter %s, expected state=, name=, prio<op> or stack<op>" % arg)
+    key, op, value = m.groups()
+    if ( key == "state" or key == "name" ):
+      if ( op not in ("=", "==", "!=") ):
+        raise ValueError("Only = and != are valid for %s" % key)
+      equal = ( op != "!=" )
+      if ( key == "name" ):
+        self._names.append( (value, equal) )
+        return
+      try:
+        states = StateMap[value.lower()]
+      except KeyError:
+        raise ValueError("Unknown state %s" % value)
+      if ( equal ):
+        if ( self._states is None ):
+          self._states = list(states)
+        else:
+          self._states = [st for st in self._states if st in states]
+      else:
+        self._excludedStates.extend(states)
+      return
+    try:
+      value = int(value, 0)
+    except ValueError:
+      raise ValueError("Invalid number in %s" % arg)
+    if ( key == "prio" ):
+      self._priorities.append( (_Operators[op], value) )
+    else:
+      self._stacks.append( (_Operators[op], value) )
+
+  def IsEmpty(self):
+    return( self._states is None and len(self._excludedStates) == 0 and
+            len(self._names) == 0 and len(self._priorities) == 0 and
+            len(self._stacks) == 0 )
+
+  def _wants(self, state):
+    if ( state in self._excludedStates ):
+      return(False)
+    return( self._states is None or state in self._states )
+
+  def WantsState(self, label):
+    """ Return True if the kernel list with the given label must be walked
+    """
+    return( any([self._wants(st) for st in ListStates[label]]) )
+
+  def MatchesState(self, label, tcb):
+    """ Check the state filter against the TCB at address tcb found in
+        the kernel list with the given label, the event list item is
+        only read when the list holds several states
+    """
+    states = [st for st in ListStates[label] if self._wants(st)]
+    if ( len(states) == len(ListStates[label]) ):
+      return(True)
+    if ( len(states) == 0 ):
+      return(False)
+    waiting = ( self._readEventContainer(gdb.selected_inferior(), tcb) != 0 )
+    return( ("waiting" if waiting else "suspended") in states )
+
+  #
+  # Offsets / sizes of the TCB fields we may read, computed once
+  #
+  def _getFields(self):
+    if ( self._fields is None ):
+      self._fields = {}
+      for f in TaskInspector.TCBType.fields():
+        self._fields[f.name] = (f.bitpos // 8, f.type.sizeof)
+    return(self._fields)
+
+  def _readField(self, inferior, tcb, name):
+    offset, size = self._getFields()[name]
+    return( bytes(inferior.read_memory(tcb + offset, size)) )
+
+  def _readEventContainer(self, inferior, tcb):
+    """ Return xEventListItem.pxContainer (pvContainer before FreeRTOS 10)
+    """
+    offset, size = self._getFields()["xEventListItem"]
+    itemType = TaskInspector.TCBType['xEventListItem'].type
+    for f in itemType.fields():
+      if ( f.name in ("pxContainer", "pvContainer") ):
+        data = bytes(inferior.read_memory(tcb + offset + f.bitpos // 8, f.type.sizeof))
+        return( struct.unpack("<Q" if len(data) == 8 else "<I", data)[0] )
+    return(0)
+
+  def _readInt(self, inferior, tcb, name):
+    data = self._readField(inferior, tcb, name)
+    return( struct.unpack("<Q" if len(data) == 8 else "<I", data)[0] )
+
+  def Matches(self, tcb):
+    """ Check the name / priority / stack filters against the TCB at
+        address tcb, reading only the fields needed
+    """
+    inferior = gdb.selected_inferior()
+    if ( len(self._names) > 0 ):
+      raw = self._readField(inferior, tcb, "pcTaskName")
+      name = raw.split(b"\0")[0].decode("ascii", "replace")
+      for pattern, equal in self._names:
+        if ( fnmatch.fnmatchcase(name, pattern) != equal ):
+          return(False)
+    if ( len(self._priorities) > 0 ):
+      priority = self._readInt(inferior, tcb, "uxPriority")
+      for op, value in self._priorities:
+        if ( not op(priority, value) ):
+          return(False)
+    if ( len(self._stacks) > 0 ):
+      top = self._readInt(inferior, tcb, "pxTopOfStack")
+      base = self._readInt(inferior, tcb, "pxStack")
+      wordSize = TaskInspector.TCBType['pxStack'].type.target().sizeof
+      free = (top - base) // wordSize
+      for op, value in self._stacks:
+        if ( not op(free, value) ):
+          return(False)
+    return(True)
@@ -0,0 +1,238 @@
+# File: Trace.py
+#
+# Description:
+#   This file contains a context switch recorder. An internal
+# breakpoint that never stops the target is put on vTaskSwitchContext
+# (or on a function called from traceTASK_SWITCHED_IN), each hit
+# stores the current TCB, the tick count and a host timestamp in a
+# preallocated ring buffer.
+#
+#   At the entry of vTaskSwitchContext pxCurrentTCB is still the task
+# being switched out (outgoing), so it ran until the hit. With a
+# location called once the switch is done (incoming), it is the task
+# switched in, which runs from the hit on. The caller says which one
+# it is, residency is computed accordingly.
+#
+#   Each hit is a full halt / resume through the probe, which slows
+# the target down. To measure it, the target first runs for a short
+# window without the breakpoint to get the host time per tick. The
+# tick timer stops while the core is halted, so over the trace
+#   host time = ticks * baseline + hits * overhead per hit
+# The residency in seconds includes that overhead.
+#
+#   Binary trace format, little endian :
+#     header  "FRTR" version(u32) count(u32) incoming(u32)
+#     records tcb(u32) tick(u32) timestamp(f64)  in chronological order
+#
+
+import gdb
+import os
+import signal
+import struct
+import threading
+import time
+from array import array
+
+from Smp import CoreMap
+from Task import TaskInspector
+
+TRACE_MAGIC = b"FRTR"
+TRACE_VERSION = 1
+DEFAULT_LOCATION = "vTaskSwitchContext"
+CALIBRATION_WINDOW = 0.5   # seconds run without the breakpoint
+
+class SwitchBreakpoint(gdb.Breakpoint):
+  """ Internal breakpoint recording the switch and letting the target run
+  """
+  def __init__(self, recorder, location):
+    super(SwitchBreakpoint, self).__init__(location, gdb.BP_BREAKPOINT, internal = True)
+    self.silent = True
+    self._recorder = recorder
+
+  def stop(self):
+    self._recorder.Record()
+    return(False)
+
+class TraceRecorder:
+  """ Ring buffer of (tcb, tick, timestamp)
+  """
+  def __init__(self, location = DEFAULT_LOCATION, capacity = 65536, incoming = False):
+    self._location = location
+    self._incoming = incoming
+    self._capacity = capacity
+    self._tcbs = array("I", [0]) * capacity
+    self._ticks = array("I", [0]) * capacity
+    self._times = array("d", [0.0]) * capacity
+    self._count = 0
+    self._baseline = None   # host seconds per tick without tracing
+    self._breakpoint = None
+
+    # pxCurrentTCB(s) and xTickCount are fetched with one read when they
+    # are close, which is the case when tasks.c statics are kept together
+    self._cores = CoreMap()
+    self._inferior = None
+    tcbStart = self._cores.address
+    tcbEnd = tcbStart + 4 * self._cores.nbCores
+    tickStart = int(gdb.parse_and_eval("&xTickCount"))
+    start = min(tcbStart, tickStart)
+    end = max(tcbEnd, tickStart + 4)
+    if ( end - start <= 256 ):
+      self._spans = [ (start, end - start) ]
+      self._tcbOffset = (0, tcbStart - start)
+      self._tickOffset = (0, tickStart - start)
+    else:
+      self._spans = [ (tcbStart, tcbEnd - tcbStart), (tickStart, 4) ]
+      self._tcbOffset = (0, 0)
+      self._tickOffset = (1, 0)
+    self._threads = None
+
+  def IsRunning(self):
+    return( self._breakpoint is not None )
+
+  def _readTick(self):
+    return( int(gdb.parse_and_eval("xTickCount")) & 0xffffffff )
+
+  def Calibrate(self, window = CALIBRATION_WINDOW):
+    """ Run the target for window seconds without the breakpoint and
+        keep the host time per tick, the target is halted again after
+    """
+    fired = []
+    def interrupt():
+      fired.append(True)
+      os.kill(os.getpid(), signal.SIGINT)
+    tick0 = self._readTick()
+    timer = threading.Timer(window, interrupt)
+    timer.daemon = True
+    t0 = time.time()
+    timer.start()
+    try:
+      gdb.execute("continue", to_string = True)
+    finally:
+      timer.cancel()
+    elapsed = time.time() - t0
+    ticks = (self._readTick() - tick0) & 0xffffffff
+    self._baseline = None
+    if ( ticks > 0 ):
+      self._baseline = elapsed / ticks
+    if ( len(fired) == 0 ):
+      print("Calibration stopped early, after %.3f s" % elapsed)
+    return(self._baseline)
+
+  def Start(self):
+    self._inferior = gdb.selected_inferior()
+    if ( self._cores.IsSmp() ):
+      self._threads = self._cores.GetThreads()
+    self._breakpoint = SwitchBreakpoint(self, self._location)
+
+  def Stop(self):
+    if ( self._breakpoint is not None ):
+      self._breakpoint.delete()
+      self._breakpoint = None
+
+  def Record(self):
+    """ Called on each hit, keep it short
+    """
+    blocks = [self._inferior.read_memory(address, size) for address, size in self._spans]
+    core = 0
+    if ( self._threads is not None ):
+      core = self._cores.GetSelectedCore(self._threads)
+    block, offset = self._tcbOffset
+    tcb = struct.unpack_from("<I", blocks[block], offset + 4 * core)[0]
+    block, offset = self._tickOffset
+    tick = struct.unpack_from("<I", blocks[block], offset)[0]
+    index = self._count % self._capacity
+    self._tcbs[index] = tcb
+    self._ticks[index] = tick
+    self._times[index] = time.time()
+    self._count += 1
+
+  def GetRecords(self):
+    """ Return the (tcb, tick, timestamp) still in the ring buffer, oldest first
+    """
+    nb = min(self._count, self._capacity)
+    first = self._count - nb
+    resp = []
+    for i in range(first, self._count):
+      index = i % self._capacity
+      resp.append( (self._tcbs[index], self._ticks[index], self._times[index]) )
+    return(resp)
+
+  def GetOverhead(self):
+    """ Return the host seconds added by each hit (halt, reads, resume),
+        (traced host time - ticks * baseline) / hits, None without
+        calibration or with less than two records
+    """
+    records = self.GetRecords()
+    if ( self._baseline is None or len(records) < 2 ):
+      return(None)
+    ticks = 0
+    for i in range(1, len(records)):
+      ticks += (records[i][1] - records[i-1][1]) & 0xffffffff
+    traced = records[-1][2] - records[0][2]
+    return( (traced - ticks * self._baseline) / (len(records) - 1) )
+
+  def GetSummary(self):
+    """ Return a list of (tcb, switches, residency in s, residency in ticks)
+    """
+    records = self.GetRecords()
+    stats = {}
+    for i, (tcb, tick, timestamp) in enumerate(records):
+      entry = stats.setdefault(tcb, [0, 0.0, 0])
+      entry[0] += 1
+      if ( self._incoming ):
+        # runs from this hit to the next one
+        if ( i + 1 < len(records) ):
+          entry[1] += records[i+1][2] - timestamp
+          entry[2] += (records[i+1][1] - tick) & 0xffffffff
+      elif ( i > 0 ):
+        # ran from the previous hit to this one
+        entry[1] += timestamp - records[i-1][2]
+        entry[2] += (tick - records[i-1][1]) & 0xffffffff
+    resp = [ (tcb, e[0], e[1], e[2]) for tcb, e in stats.items() ]
+    resp.sort(key = lambda e: -e[2])
+    return(resp)
+
+  def Write(self, fileName):
+    records = self.GetRecords()
+    with open(fileName, "wb") as f:
+      f.write(TRACE_MAGIC + struct.pack("<3I", TRACE_VERSION, len(records), int(self._incoming)))
+      for tcb, tick, timestamp in records:
+        f.write(struct.pack("<IId", tcb, tick, timestamp))
+    return(len(records))
+
+  def PrintSummary(self):
+    summary = self.GetSummary()
+    total = sum([e[2] for e in summary])
+    print("Switches recorded: %d (%d kept)" % (self._count, min(self._count, self._capacity)))
+    # TIME(s) is host time, it includes the overhead of each hit
+    print("%16s %8s %10s %10s %6s" % ("TASK", "SWITCHES", "TIME(s)", "TICKS", "%"))
+    for tcb, switches, seconds, ticks in summary:
+      percent = 0.0
+      if ( total > 0 ):
+        percent = 100.0 * seconds / total
+      print("%16s %8d %10.4f %10d %6.2f" % (_taskName(tcb), switches, seconds, ticks, percent))
+    overhead = self.GetOverhead()
+    if ( overhead is None ):
+      print("Overhead per switch not measured (no calibration or not enough switches)")
+      return
+    print("Host time per tick without tracing: %.3f ms" % (self._baseline * 1e3))
+    print("Overhead per switch: %.1f us (halt, %d read(s), resume), included in TIME(s)" % (overhead * 1e6, len(self._spans)))
+
+def _taskName(tcb):
+  try:
+    tcbObj = gdb.Value(tcb).cast(TaskInspector.TCBType.pointer())
+    return( TaskInspector(tcbObj.dereference()).GetName() )
+  except Exception:
+    return( "0x%08x" % tcb )
+
+_recorder = None
+
+def GetRecorder():
+  """ The recorder of the gdb session, None if never started
+  """
+  return(_recorder)
+
+def NewRecorder(location = DEFAULT_LOCATION, capacity = 65536, incoming = False):
+  global _recorder
+  _recorder = TraceRecorder(location, capacity, incoming)
+  return(_recorder)
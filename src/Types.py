@@ -1,13 +1,50 @@
 # File: Types.py
 # Author: Carl Allendorph
-# Date: 05NOV2014 
-# 
+# Date: 05NOV2014
+#
 # Description:
-#    This file contains the implementation of some 
-# standard types 
+#    This file contains the implementation of some
+# standard types
+#
+#    The types are looked up the first time they are used, not when
+# the modules are loaded, and cached until the symbols change. This
+# keeps sourcing FreeRTOS.py fast on big ELF files and lets the
+# commands load even if some kernel types are not in the image.
 
-import gdb 
+import gdb
+
+_typeCache = {}
+
+def _clearTypeCache(event):
+  _typeCache.clear()
+
+gdb.events.new_objfile.connect(_clearTypeCache)
+gdb.events.clear_objfiles.connect(_clearTypeCache)
+
+def LookupType(name):
+  """ gdb.lookup_type with a cache, raise a L{gdb.GdbError} with a
+      readable message if the type is not in the program
+  """
+  try:
+    return(_typeCache[name])
+  except KeyError:
+    pass
+  try:
+    t = gdb.lookup_type(name)
+  except gdb.error:
+    raise gdb.GdbError("Type %s not found, is this part of FreeRTOS compiled in?" % name)
+  _typeCache[name] = t
+  return(t)
+
+class LazyType(object):
+  """ Class attribute resolved to a L{gdb.Type} on first access
+  """
+  def __init__(self, name):
+    self._name = name
+
+  def __get__(self, obj, owner):
+    return(LookupType(self._name))
 
 class StdTypes:
-  uint32_t = gdb.lookup_type("uint32_t")
-  uint16_t = gdb.lookup_type("uint16_t")
+  uint32_t = LazyType("uint32_t")
+  uint16_t = LazyType("uint16_t")